@@ -1,12 +1,20 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Header, BackgroundTasks
-from fastapi.responses import Response, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from backend.services.gemini_service import GeminiService
 from backend.services.vton_service import VTONService
 from backend.services.video_service import VideoService
 from backend.services.gemini_text_service import GeminiTextService
 from backend.services.local_storage_service import LocalStorageService
+from backend.services.export_service import ExportService
+from backend.services.tracing_service import TracingMiddleware, span, traced_task
+from backend.services.circuit_breaker_service import CircuitOpenError
+from backend.services.memory_budget_service import MemoryBudget, MemoryBudgetMiddleware, track_bytes
+from backend.services.vertex_router_service import get_router
+from backend.services.edit_session_service import EditSessionService, EditSessionNotFound
+from backend.services.video_postprocess_service import VideoPostProcessService
+from backend.services.media_service import ImmutableStaticFiles, MEDIA_DIR, MEDIA_ROUTE
 import uvicorn
 import io
 import uuid
@@ -18,22 +26,40 @@ from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="Banana Fashion Backend")
 
+# Media-heavy endpoints hold whole request and result bodies in memory (including in
+# background save closures), so they are admitted against a shared byte budget.
+# Added first so it runs inside CORS and tracing: 503s get CORS headers and budget-wait is timed.
+memory_budget = MemoryBudget()
+app.add_middleware(
+    MemoryBudgetMiddleware,
+    budget=memory_budget,
+    paths=["/try-on", "/edit-image", "/edit-sessions", "/generate-video", "/generate-image", "/assets/upload"],
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origin_regex="http://localhost:\d+",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id", "X-Edit-Session-Id"],
 )
+# Per-request timing: Server-Timing header plus optional OTLP/JSON export (see tracing_service)
+app.add_middleware(TracingMiddleware)
 
 # Initialize services
+# All Vertex services share one router, so latency/error stats are pooled per model
+vertex_router = get_router()
 gemini_service = GeminiService()
 vton_service = VTONService()
 video_service = VideoService()
 gemini_text_service = GeminiTextService()
+edit_session_service = EditSessionService(gemini_service)
+video_postprocess_service = VideoPostProcessService()
 # storage_service = LocalStorageService()
 from backend.services.firebase_service import FirebaseService
 storage_service = FirebaseService()
+export_service = ExportService(storage_service)
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
 
@@ -41,9 +67,9 @@ from typing import Optional
 security = HTTPBearer(auto_error=False)
 
 # Mount media directory (keep for fallback or temp files if needed)
-media_path = os.path.join(os.path.dirname(__file__), "media")
-os.makedirs(media_path, exist_ok=True)
-app.mount("/media", StaticFiles(directory=media_path), name="media")
+# Content-hashed files are served as immutable, with byte-range support for video seeking
+os.makedirs(MEDIA_DIR, exist_ok=True)
+app.mount(MEDIA_ROUTE, ImmutableStaticFiles(directory=MEDIA_DIR), name="media")
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not credentials:
@@ -59,7 +85,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         # We use the storage_service (which is FirebaseService) to verify
         # or we can call auth.verify_id_token directly if we import it.
         # Since storage_service has verify_token method, let's use it.
-        decoded_token = storage_service.verify_token(token)
+        # Token checks can hit the cache backend or Google's key endpoint, so keep them off the event loop
+        with span("auth"):
+            decoded_token = await run_in_threadpool(storage_service.verify_token, token)
         
         if not decoded_token:
              raise HTTPException(
@@ -82,9 +110,58 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def video_asset_fields(video_info):
+    """Asset fields describing a video; posterUrl is filled in once a poster is uploaded."""
+    return {
+        "duration": video_info.get("duration"),
+        "width": video_info.get("width"),
+        "height": video_info.get("height"),
+        "posterUrl": None,
+    }
+
+def upload_video_poster(uid, vid_bytes, video_info):
+    """Extracts and uploads a poster frame; returns its URL, or None if that failed."""
+    # Skip the very first frame, which is often black on fade-ins
+    at_seconds = min(1.0, (video_info.get("duration") or 0) / 2)
+    poster_bytes = video_postprocess_service.extract_poster(vid_bytes, at_seconds)
+    if not poster_bytes:
+        return None
+    poster_filename = f"{uid}/{uuid.uuid4()}_poster.jpg"
+    try:
+        return storage_service.upload_file(poster_bytes, poster_filename, "image/jpeg")
+    except Exception as e:
+        print(f"Poster upload failed: {e}")
+        return None
+
+def attach_video_poster(uid, asset_id, vid_bytes, video_info):
+    """Background task: adds a poster frame to an already saved video asset."""
+    poster_url = upload_video_poster(uid, vid_bytes, video_info)
+    if poster_url:
+        try:
+            storage_service.update_asset(uid, asset_id, {"posterUrl": poster_url})
+        except Exception as e:
+            print(f"Poster update failed for asset {asset_id}: {e}")
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request, exc: CircuitOpenError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 def health_check():
-    return {"status": "ok", "project": "banana-fashion-local"}
+    circuits = storage_service.circuit_status()
+    degraded = any(c["state"] != "closed" for c in (circuits["storage"], circuits["firestore"]))
+    return {
+        "status": "degraded" if degraded else "ok",
+        "project": "banana-fashion-local",
+        "circuits": circuits,
+        "memoryBudget": memory_budget.stats(),
+        "vertexEndpoints": vertex_router.status(),
+        "editSessions": edit_session_service.stats()
+    }
 
 import httpx
 
@@ -98,6 +175,15 @@ async def proxy_image(url: str):
 def get_assets(type: str = None, limit: int = None, user: dict = Depends(get_current_user)):
     return storage_service.get_assets(user['uid'], type, limit)
 
+@app.get("/assets/export")
+def export_assets(type: str = None, user: dict = Depends(get_current_user)):
+    assets = storage_service.get_assets(user['uid'], type)
+    # The archive is built while it is sent, so memory stays flat regardless of library size
+    return StreamingResponse(
+        export_service.stream_zip(user['uid'], assets),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="banana-fashion-assets.zip"'}
+    )
 
 class AssetCreate(pydantic.BaseModel):
     url: str
@@ -115,6 +201,21 @@ def update_asset(asset_id: str, updates: AssetUpdate, user: dict = Depends(get_c
     storage_service.update_asset(user['uid'], asset_id, updates.dict())
     return {"status": "success"}
 
+class AssetBulkDelete(pydantic.BaseModel):
+    ids: Optional[list[str]] = None
+    type: Optional[str] = None
+    older_than: Optional[float] = None  # createdAt cutoff in ms, as returned by GET /assets
+
+@app.post("/assets/bulk-delete")
+def bulk_delete_assets(request: AssetBulkDelete, user: dict = Depends(get_current_user)):
+    if not (request.ids or request.type or request.older_than):
+        raise HTTPException(status_code=400, detail="Provide ids, type or older_than")
+    results = storage_service.delete_assets(user['uid'], request.ids, request.type, request.older_than)
+    return {
+        "deleted": sum(1 for r in results if r["status"] == "deleted"),
+        "results": results
+    }
+
 @app.delete("/assets/{asset_id}")
 def delete_asset(asset_id: str, user: dict = Depends(get_current_user)):
     success = storage_service.delete_asset(user['uid'], asset_id)
@@ -124,12 +225,14 @@ def delete_asset(asset_id: str, user: dict = Depends(get_current_user)):
 
 @app.post("/assets/upload")
 async def upload_asset(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     type: str = Form(...),
     user: dict = Depends(get_current_user)
 ):
     try:
-        content = await file.read()
+        with span("read-body"):
+            content = await file.read()
         # Simple extension detection
         ext = "png"
         if file.filename and "." in file.filename:
@@ -137,6 +240,10 @@ async def upload_asset(
         elif file.content_type == "video/mp4":
             ext = "mp4"
             
+        video_info = None
+        if ext == "mp4" or file.content_type == "video/mp4":
+            content, video_info = await run_in_threadpool(video_postprocess_service.process, content)
+
         filename = f"{user['uid']}/{uuid.uuid4()}.{ext}"
         public_url = storage_service.upload_file(content, filename, file.content_type or "image/png")
         
@@ -144,8 +251,13 @@ async def upload_asset(
             "url": public_url,
             "type": type,
             "category": "user-data",
-            "requestId": None
+            "requestId": None,
+            **(video_asset_fields(video_info) if video_info else {})
         })
+
+        if video_info:
+            # ffmpeg can take a while, so the poster is added after responding
+            background_tasks.add_task(traced_task("save-video-poster", attach_video_poster), user['uid'], asset_id, content, video_info)
         
         return {"id": asset_id, "url": public_url}
     except Exception as e:
@@ -154,7 +266,7 @@ async def upload_asset(
 # --- Generation Endpoints (Multipart/Form-Data) ---
 
 @app.post("/generate-image")
-def generate_image(
+async def generate_image(
     background_tasks: BackgroundTasks,
     prompt: str = Form(...),
     aspect_ratio: str = Form("3:4"),
@@ -163,7 +275,8 @@ def generate_image(
     user: dict = Depends(get_current_user)
 ):
     try:
-        image_bytes = gemini_service.generate_image(prompt, aspect_ratio, model, resolution)
+        image_bytes = await gemini_service.generate_image(prompt, aspect_ratio, model, resolution)
+        track_bytes(len(image_bytes))
         
         def save_gen_assets(uid, img_bytes, p):
             filename = f"{uid}/{uuid.uuid4()}_gen.png"
@@ -177,14 +290,12 @@ def generate_image(
                 "model": model
             })
             
-        background_tasks.add_task(save_gen_assets, user['uid'], image_bytes, prompt)
+        background_tasks.add_task(traced_task("save-gen-assets", save_gen_assets), user['uid'], image_bytes, prompt)
         
         return Response(content=image_bytes, media_type="image/png")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi.concurrency import run_in_threadpool
-
 # ... imports ...
 
 @app.post("/try-on")
@@ -196,10 +307,12 @@ async def try_on(
     user: dict = Depends(get_current_user)
 ):
     try:
-        person_bytes = await person_image.read()
-        garment_bytes = await garment_image.read()
+        with span("read-body"):
+            person_bytes = await person_image.read()
+            garment_bytes = await garment_image.read()
 
-        result_bytes = await run_in_threadpool(vton_service.try_on, person_bytes, garment_bytes, category)
+        result_bytes = await vton_service.try_on(person_bytes, garment_bytes, category)
+        track_bytes(len(result_bytes))
         
         def save_tryon_assets(uid, r_bytes, p_filename, g_filename):
             try:
@@ -225,7 +338,7 @@ async def try_on(
                 import traceback
                 traceback.print_exc()
 
-        background_tasks.add_task(save_tryon_assets, user['uid'], result_bytes, person_image.filename, garment_image.filename)
+        background_tasks.add_task(traced_task("save-tryon-assets", save_tryon_assets), user['uid'], result_bytes, person_image.filename, garment_image.filename)
 
         return Response(content=result_bytes, media_type="image/jpeg")
     except Exception as e:
@@ -240,8 +353,10 @@ async def edit_image(
     user: dict = Depends(get_current_user)
 ):
     try:
-        image_bytes = await image.read()
+        with span("read-body"):
+            image_bytes = await image.read()
         edited_image_bytes = await run_in_threadpool(gemini_service.edit_image, image_bytes, prompt, image.content_type or "image/png", model)
+        track_bytes(len(edited_image_bytes))
         
         def save_edit_assets(uid, edited_bytes, p, input_filename):
             # Save Output
@@ -256,26 +371,76 @@ async def edit_image(
                 "parentFilename": input_filename
             })
 
-        background_tasks.add_task(save_edit_assets, user['uid'], edited_image_bytes, prompt, image.filename)
+        background_tasks.add_task(traced_task("save-edit-assets", save_edit_assets), user['uid'], edited_image_bytes, prompt, image.filename)
 
         return Response(content=edited_image_bytes, media_type="image/png")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-from backend.services.gemini_text_service import GeminiTextService
+def save_session_edit_asset(uid, edited_bytes, p, session_id):
+    output_filename = f"{uid}/{uuid.uuid4()}_output.png"
+    output_url = storage_service.upload_file(edited_bytes, output_filename, "image/png")
+    storage_service.save_asset(uid, {
+        "url": output_url,
+        "type": "edited-image",
+        "category": "user-generated-data",
+        "prompt": p,
+        "source": "edit-session-output",
+        "editSessionId": session_id
+    })
+
+@app.post("/edit-sessions")
+async def create_edit_session(
+    background_tasks: BackgroundTasks,
+    image: UploadFile = File(...),
+    prompt: str = Form(...),
+    model: str = Form("gemini-2.5-flash-image"),
+    user: dict = Depends(get_current_user)
+):
+    """Starts a multi-turn edit: uploads the image once and applies the first prompt."""
+    try:
+        with span("read-body"):
+            image_bytes = await image.read()
+        session = edit_session_service.create(user['uid'], image_bytes, image.content_type or "image/png", model)
+        try:
+            edited_image_bytes = await run_in_threadpool(edit_session_service.edit, user['uid'], session.id, prompt)
+        except Exception:
+            # The client never learns the id, so don't keep the image held until the TTL
+            edit_session_service.delete(user['uid'], session.id)
+            raise
+        track_bytes(len(edited_image_bytes))
+
+        background_tasks.add_task(traced_task("save-edit-assets", save_session_edit_asset), user['uid'], edited_image_bytes, prompt, session.id)
+
+        return Response(content=edited_image_bytes, media_type="image/png", headers={"X-Edit-Session-Id": session.id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-# ... imports ...
+@app.post("/edit-sessions/{session_id}/edit")
+async def edit_in_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    prompt: str = Form(...),
+    user: dict = Depends(get_current_user)
+):
+    """Applies a follow-up prompt to the session's latest image; no image upload needed."""
+    try:
+        edited_image_bytes = await run_in_threadpool(edit_session_service.edit, user['uid'], session_id, prompt)
+        track_bytes(len(edited_image_bytes))
 
-# Initialize services
-gemini_service = GeminiService()
-vton_service = VTONService()
-video_service = VideoService()
-gemini_text_service = GeminiTextService()
-# storage_service = LocalStorageService()
-from backend.services.firebase_service import FirebaseService
-storage_service = FirebaseService()
+        background_tasks.add_task(traced_task("save-edit-assets", save_session_edit_asset), user['uid'], edited_image_bytes, prompt, session_id)
 
-# ... existing code ...
+        return Response(content=edited_image_bytes, media_type="image/png", headers={"X-Edit-Session-Id": session_id})
+    except EditSessionNotFound:
+        raise HTTPException(status_code=404, detail="Edit session not found or expired")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/edit-sessions/{session_id}")
+def delete_edit_session(session_id: str, user: dict = Depends(get_current_user)):
+    if not edit_session_service.delete(user['uid'], session_id):
+        raise HTTPException(status_code=404, detail="Edit session not found")
+    return {"status": "success"}
 
 @app.post("/generate-video")
 async def generate_video(
@@ -290,23 +455,29 @@ async def generate_video(
     try:
         image_bytes = None
         if image:
-            image_bytes = await image.read()
+            with span("read-body"):
+                image_bytes = await image.read()
 
         video_bytes = await run_in_threadpool(video_service.generate_video, prompt, image_bytes, duration_seconds, aspect_ratio, generate_audio)
+        # Rewrite to faststart so the client can begin playback before the download finishes
+        video_bytes, video_info = await run_in_threadpool(video_postprocess_service.process, video_bytes)
+        track_bytes(len(video_bytes))
         
         def save_video_assets(uid, vid_bytes, p, input_filename):
             v_filename = f"{uid}/{uuid.uuid4()}.mp4"
             v_url = storage_service.upload_file(vid_bytes, v_filename, "video/mp4")
+            video_fields = {**video_asset_fields(video_info), "posterUrl": upload_video_poster(uid, vid_bytes, video_info)}
             storage_service.save_asset(uid, {
                 "url": v_url,
                 "type": "generated-video",
                 "category": "user-generated-data",
                 "prompt": p,
                 "inputImageFilename": input_filename,
-                "source": "text-to-video" if not input_filename else "image-to-video"
+                "source": "text-to-video" if not input_filename else "image-to-video",
+                **video_fields
             })
 
-        background_tasks.add_task(save_video_assets, user['uid'], video_bytes, prompt, image.filename if image else None)
+        background_tasks.add_task(traced_task("save-video-assets", save_video_assets), user['uid'], video_bytes, prompt, image.filename if image else None)
 
         return Response(content=video_bytes, media_type="video/mp4")
     except Exception as e:
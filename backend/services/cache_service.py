@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Selects the shared cache used by the services: "sqlite", "redis" or "memory"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache", "cache.sqlite3"))
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_PREFIX = "bf:"
+# SQLite reads refresh an entry's LRU timestamp at most this often, so hits rarely need the write lock
+CACHE_ACCESS_REFRESH = 60
+
+
+class BaseCache:
+    """Key/value cache with TTLs and tag-based invalidation.
+
+    Values must be JSON-serializable. Keys can be grouped under a tag with `tagged_key`;
+    `invalidate(tag)` bumps the tag's version in the backend itself, so every worker
+    sharing the backend stops seeing the old entries at once. `shared` is False for
+    backends that can't do that, and callers skip caching data that writes invalidate.
+    """
+
+    shared = True
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _incr(self, key):
+        raise NotImplementedError
+
+    def tagged_key(self, tag, key):
+        """Returns key under the tag's current version.
+
+        Resolve it once, before loading the value, so a concurrent invalidation
+        can't be overwritten by stale data.
+        """
+        try:
+            version = self._get(f"{CACHE_PREFIX}tag:{tag}") or 0
+        except Exception as e:
+            print(f"Cache get failed: {e}")
+            version = "x"
+        return f"{tag}@{version}:{key}"
+
+    def get(self, key, default=None):
+        try:
+            raw = self._get(CACHE_PREFIX + key)
+        except Exception as e:
+            print(f"Cache get failed: {e}")
+            return default
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        try:
+            self._set(CACHE_PREFIX + key, json.dumps(value), ttl)
+        except Exception as e:
+            print(f"Cache set failed: {e}")
+
+    def delete(self, key):
+        try:
+            self._delete(CACHE_PREFIX + key)
+        except Exception as e:
+            print(f"Cache delete failed: {e}")
+
+    def invalidate(self, tag):
+        """Drops every entry stored under tag, for all workers sharing this backend."""
+        try:
+            self._incr(f"{CACHE_PREFIX}tag:{tag}")
+        except Exception as e:
+            print(f"Cache invalidate failed: {e}")
+
+
+class MemoryCache(BaseCache):
+    """Per-process LRU cache. Fast, but each worker has its own copy."""
+
+    shared = False
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # Tag versions live outside the LRU so eviction can't resurrect invalidated entries
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        with self.lock:
+            if key in self.versions:
+                return self.versions[key]
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl if ttl else None)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def _incr(self, key):
+        with self.lock:
+            self.versions[key] = self.versions.get(key, 0) + 1
+            return self.versions[key]
+
+
+class SQLiteCache(BaseCache):
+    """On-disk cache shared by all worker processes on a host (SQLite in WAL mode)."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            return None  # Removed by the next _evict
+        if row[2] is None or now - row[2] > CACHE_ACCESS_REFRESH:
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _set(self, key, value, ttl):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl if ttl else None, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        # Tag versions never expire and must survive eviction, or stale entries would reappear
+        overflow = conn.execute(
+            "SELECT COUNT(*) FROM cache WHERE key NOT LIKE ?", (f"{CACHE_PREFIX}tag:%",)
+        ).fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE key NOT LIKE ? "
+                "ORDER BY accessed_at LIMIT ?)",
+                (f"{CACHE_PREFIX}tag:%", overflow),
+            )
+
+    def _delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _incr(self, key):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO cache (key, value, expires_at, accessed_at) VALUES (?, '1', NULL, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            (key, time.time()),
+        )
+
+
+class RedisCache(BaseCache):
+    """Cache on any Redis-protocol server, shared across workers and hosts.
+
+    Pass `client` to use an existing client, e.g. a local Redis-compatible stand-in in tests.
+    """
+
+    def __init__(self, url=CACHE_URL, max_entries=CACHE_MAX_ENTRIES, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.max_entries = max_entries
+        # Sorted set of key -> last access time, used for LRU eviction
+        self.index_key = f"{CACHE_PREFIX}index"
+
+    def _get(self, key):
+        value = self.client.get(key)
+        if value is not None and not key.startswith(f"{CACHE_PREFIX}tag:"):
+            self.client.zadd(self.index_key, {key: time.time()})
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _set(self, key, value, ttl):
+        pipe = self.client.pipeline()
+        if ttl:
+            pipe.set(key, value, px=int(ttl * 1000))
+        else:
+            pipe.set(key, value)
+        pipe.zadd(self.index_key, {key: time.time()})
+        pipe.zcard(self.index_key)
+        overflow = pipe.execute()[-1] - self.max_entries
+        if overflow > 0:
+            evicted = [k for k, _ in self.client.zpopmin(self.index_key, overflow)]
+            if evicted:
+                self.client.delete(*evicted)
+
+    def _delete(self, key):
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.zrem(self.index_key, key)
+        pipe.execute()
+
+    def _incr(self, key):
+        return self.client.incr(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process-wide cache selected by CACHE_BACKEND."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if CACHE_BACKEND == "sqlite":
+                _cache = SQLiteCache()
+            elif CACHE_BACKEND == "redis":
+                _cache = RedisCache()
+            else:
+                _cache = MemoryCache()
+        return _cache
@@ -0,0 +1,112 @@
+import time
+import threading
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited because its dependency is known to be down."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency and probes it in the background until it recovers.
+
+    After `failure_threshold` consecutive failures the circuit opens and `allow()` returns
+    False. Once `recovery_timeout` has passed, the next `allow()` starts a half-open check
+    by running `probe` on a background thread. A successful probe closes the circuit and
+    runs `on_close`; a failed one keeps it open for another timeout. Exceptions listed in
+    `excluded_exceptions` (e.g. "not found") pass through without counting as failures.
+    """
+
+    def __init__(self, name, probe, failure_threshold=5, recovery_timeout=30, on_close=None, excluded_exceptions=()):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.on_close = on_close
+        self.excluded_exceptions = excluded_exceptions
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = HALF_OPEN
+                threading.Thread(target=self._run_probe, name=f"{self.name}-probe", daemon=True).start()
+            return False
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.recovery_timeout - (time.monotonic() - self.opened_at)))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self, error=None):
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error) if error else None
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                print(f"Circuit {self.name} opened after {self.failures} failures: {error}")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        except Exception as e:
+            with self.lock:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.last_error = str(e)
+            return
+
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.last_error = None
+        print(f"Circuit {self.name} closed")
+        if self.on_close:
+            try:
+                self.on_close()
+            except Exception as e:
+                print(f"Circuit {self.name} on_close failed: {e}")
+
+    def call(self, func, *args, **kwargs):
+        """Runs func through the breaker, raising CircuitOpenError while the circuit is open."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        try:
+            result = func(*args, **kwargs)
+        except self.excluded_exceptions:
+            self.record_success()
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def status(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retryAfter": self.retry_after() if self.state != CLOSED else 0,
+                "lastError": self.last_error,
+            }
@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from google.genai import types
+
+EDIT_SESSION_TTL = int(os.getenv("EDIT_SESSION_TTL", "1800"))
+# Total bytes of image data held by all sessions in this worker
+EDIT_SESSION_MAX_BYTES = int(os.getenv("EDIT_SESSION_MAX_MB", "256")) * 1024 * 1024
+# Past this many turns the history is collapsed onto the latest image to keep requests small
+EDIT_SESSION_MAX_TURNS = 4
+
+
+class EditSessionNotFound(Exception):
+    pass
+
+
+class EditSession:
+    def __init__(self, user_id, image_bytes, mime_type, model):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.model = model
+        # Image the next turn starts from when there is no history to refer back to
+        self.base_image = (image_bytes, mime_type)
+        self.history = []
+        self.turns = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        total = len(self.base_image[0])
+        for content in self.history:
+            for part in content.parts or []:
+                if part.inline_data and part.inline_data.data:
+                    total += len(part.inline_data.data)
+        return total
+
+
+class EditSessionService:
+    """Keeps multi-turn image edit conversations server-side.
+
+    Follow-up edits send only the new prompt; the session supplies the prior image parts
+    and model outputs. Sessions expire after `ttl` seconds idle and the least recently
+    used are evicted once their images exceed `max_bytes`. Sessions live in the worker's
+    memory, so with several workers follow-ups must be routed to the same one (see
+    ARCHITECTURE.md); a follow-up that lands elsewhere gets a 404 and must start over.
+    """
+
+    def __init__(self, gemini_service, ttl=EDIT_SESSION_TTL, max_bytes=EDIT_SESSION_MAX_BYTES,
+                 max_turns=EDIT_SESSION_MAX_TURNS):
+        self.gemini_service = gemini_service
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, user_id, image_bytes, mime_type="image/png", model="gemini-2.5-flash-image"):
+        session = EditSession(user_id, image_bytes, mime_type, model)
+        with self.lock:
+            self.sessions[session.id] = session
+        self._evict()
+        return session
+
+    def get(self, user_id, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or session.user_id != user_id or self._expired(session):
+                raise EditSessionNotFound(session_id)
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, user_id, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or session.user_id != user_id:
+                return False
+            del self.sessions[session_id]
+            return True
+
+    def edit(self, user_id, session_id, prompt):
+        """Applies prompt to the session's latest image and returns the edited image bytes."""
+        session = self.get(user_id, session_id)
+        with session.lock:
+            parts = [types.Part.from_text(text=self.gemini_service.enhance_edit_prompt(prompt))]
+            if not session.history:
+                image_bytes, mime_type = session.base_image
+                parts.insert(0, types.Part.from_bytes(data=image_bytes, mime_type=mime_type))
+
+            result_bytes, model_content = self.gemini_service.edit_turn(session.history, parts, session.model)
+
+            session.turns += 1
+            session.last_used = time.monotonic()
+            if session.turns % self.max_turns == 0:
+                # Start a fresh conversation from the latest result rather than resending every turn
+                session.history = []
+                session.base_image = (result_bytes, "image/png")
+            else:
+                session.history = session.history + [types.Content(role="user", parts=parts), model_content]
+
+        with self.lock:
+            if session.id in self.sessions:
+                self.sessions.move_to_end(session.id)
+        self._evict()
+        return result_bytes
+
+    def _expired(self, session):
+        return time.monotonic() - session.last_used > self.ttl
+
+    def _evict(self):
+        """Drops expired sessions, then least recently used ones until under max_bytes."""
+        with self.lock:
+            for session_id in [sid for sid, s in self.sessions.items() if self._expired(s)]:
+                del self.sessions[session_id]
+            total = sum(s.size for s in self.sessions.values())
+            while total > self.max_bytes and len(self.sessions) > 1:
+                _, evicted = self.sessions.popitem(last=False)
+                total -= evicted.size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "bytes": sum(s.size for s in self.sessions.values()),
+                "maxBytes": self.max_bytes,
+            }
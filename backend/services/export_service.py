@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Files up to this size are fetched ahead in parallel; larger ones are streamed in chunks when written
+PREFETCH_LIMIT = 4 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+# Stored entries above this need zip64 headers, which must be chosen before the entry is written
+ZIP64_LIMIT = 0x7FFFFFFF
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file object that collects what zipfile writes until it is drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ExportService:
+    def __init__(self, storage_service, max_concurrency: int = 4):
+        self.storage_service = storage_service
+        self.max_concurrency = max_concurrency
+
+    def _entry_name(self, asset, url):
+        path = url.split("?", 1)[0]
+        ext = os.path.splitext(path)[1] or ".bin"
+        return f"{asset.get('type') or 'asset'}/{asset['id']}{ext}"
+
+    def _fetch(self, user_id, asset):
+        """Opens an asset's file; small files are read fully so the pool does the waiting."""
+        opened = self.storage_service.open_file(user_id, asset.get("url") or "")
+        if opened is None:
+            return None, None
+        size, reader = opened
+        if size <= PREFETCH_LIMIT:
+            with reader:
+                return size, reader.read()
+        return size, reader
+
+    def _close_pending(self, pending):
+        while pending:
+            _, future = pending.popleft()
+            if future.cancel():
+                continue
+            try:
+                _, content = future.result()
+            except Exception:
+                continue
+            if content is not None and not isinstance(content, bytes):
+                content.close()
+
+    def stream_zip(self, user_id, assets):
+        """Yields a ZIP archive of `assets` plus manifest.json, chunk by chunk.
+
+        The caller lists the assets first, so a failed listing surfaces as an error
+        response instead of a truncated archive sent after a 200.
+        """
+        sink = _ChunkSink()
+        manifest = []
+
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf, \
+                ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = deque()
+            queue = iter(assets)
+
+            def submit_next():
+                asset = next(queue, None)
+                if asset is not None:
+                    pending.append((asset, executor.submit(self._fetch, user_id, asset)))
+
+            for _ in range(self.max_concurrency):
+                submit_next()
+
+            try:
+                while pending:
+                    asset, future = pending.popleft()
+                    submit_next()
+
+                    record = dict(asset)
+                    record["file"] = None
+                    try:
+                        size, content = future.result()
+                        if content is None:
+                            record["error"] = "File is not stored by this service"
+                        else:
+                            name = self._entry_name(asset, asset["url"])
+                            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                            with zf.open(info, "w", force_zip64=size > ZIP64_LIMIT) as entry:
+                                # Chunks already sent can't be taken back, so a failure below
+                                # leaves a truncated entry; the manifest names it with the error
+                                record["file"] = name
+                                if isinstance(content, bytes):
+                                    entry.write(content)
+                                else:
+                                    with content:
+                                        for chunk in iter(lambda: content.read(CHUNK_SIZE), b""):
+                                            entry.write(chunk)
+                                            if sink.chunks:
+                                                yield sink.drain()
+                    except Exception as e:
+                        print(f"Export failed for asset {asset.get('id')}: {e}")
+                        record["error"] = str(e)
+                        if record["file"]:
+                            record["truncated"] = True
+
+                    manifest.append(record)
+                    if sink.chunks:
+                        yield sink.drain()
+            finally:
+                # The client may disconnect mid-export; close readers that were opened ahead
+                self._close_pending(pending)
+
+            zf.writestr(
+                "manifest.json",
+                json.dumps({"userId": user_id, "exportedAt": time.time() * 1000, "assets": manifest}, indent=2, default=str),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+
+        yield sink.drain()
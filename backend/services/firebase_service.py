@@ -3,9 +3,46 @@ from firebase_admin import credentials, firestore, storage, auth
 import os
 import time
 import uuid
+import hashlib
+import datetime
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, unquote
+from google.api_core.exceptions import NotFound, ClientError, TooManyRequests
+from backend.services.media_service import MediaService, IMMUTABLE_CACHE_CONTROL
+from backend.services.tracing_service import span
+from backend.services.cache_service import get_cache
+from backend.services.circuit_breaker_service import CircuitBreaker
+
+# Firestore rejects batched writes with more than 500 operations
+FIRESTORE_BATCH_SIZE = 500
+# Asset fields that point at stored files (the asset itself and its derivatives)
+ASSET_FILE_FIELDS = ("url", "posterUrl")
+# Upper bound on how long a verified token is trusted without re-verifying it
+TOKEN_CACHE_TTL = 300
+ASSET_LIST_CACHE_TTL = 60
+# Writes that couldn't reach Firebase wait here until the circuit closes again
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".spool")
+# Spooled files this young may still be referenced by an asset record that's about to be saved
+SPOOL_MIN_AGE = 60
+# Local URL -> bucket URL for reconciled files, so asset records replayed later still find them
+SPOOL_MOVED_DIR = os.path.join(SPOOL_DIR, "moved")
+SPOOL_MOVED_TTL = 7 * 24 * 3600
+# Entries that can never be replayed (local file gone, request rejected) are parked here for inspection
+SPOOL_DEAD_DIR = os.path.join(SPOOL_DIR, "dead")
+# How soon to retry after a replay stops on a transient error
+SPOOL_RETRY_DELAY = 60
+STORAGE_TIMEOUT = float(os.getenv("STORAGE_TIMEOUT", "30"))
+
+def _is_terminal_spool_error(error):
+    """True for replay errors that retrying can't fix: the local file is gone, or Google rejected the request."""
+    if isinstance(error, FileNotFoundError):
+        return True
+    return isinstance(error, ClientError) and not isinstance(error, TooManyRequests)
 
 class FirebaseService:
-    def __init__(self):
+    def __init__(self, cache=None):
         # Initialize Firebase Admin SDK
         # Check if already initialized to avoid errors during hot reload
         if not firebase_admin._apps:
@@ -26,11 +63,50 @@ class FirebaseService:
         
         self.db = firestore.client()
         self.bucket = storage.bucket()
+        self.media = MediaService()
+        self.cache = cache or get_cache()
+
+        # 4xx errors mean the request was wrong, not that Firebase is down
+        self.storage_breaker = CircuitBreaker(
+            "storage", self._probe_storage, on_close=self.reconcile_spool, excluded_exceptions=(ClientError,)
+        )
+        self.firestore_breaker = CircuitBreaker(
+            "firestore", self._probe_firestore, on_close=self.reconcile_spool, excluded_exceptions=(ClientError,)
+        )
+        self.reconcile_lock = threading.Lock()
+        self.reconcile_timer = None
+        os.makedirs(SPOOL_MOVED_DIR, exist_ok=True)
+        os.makedirs(SPOOL_DEAD_DIR, exist_ok=True)
+        # Pick up anything a previous process spooled but never reconciled
+        self._schedule_reconcile(0)
+
+    def _probe_storage(self):
+        list(self.bucket.list_blobs(max_results=1, timeout=10))
+
+    def _probe_firestore(self):
+        self.db.collection('users').limit(1).get(timeout=10)
+
+    def circuit_status(self):
+        """Breaker states and spool backlog, for the health check."""
+        return {
+            "storage": self.storage_breaker.status(),
+            "firestore": self.firestore_breaker.status(),
+            "spooled": len([f for f in os.listdir(SPOOL_DIR) if f.endswith(".json")]),
+            "deadLettered": len(os.listdir(SPOOL_DEAD_DIR)),
+        }
 
     def verify_token(self, token):
         """Verifies a Firebase ID token."""
+        # Key on a hash so raw tokens never land in a shared cache
+        cache_key = "token:" + hashlib.sha256(token.encode()).hexdigest()
+        cached = self.cache.get(cache_key)
+        if cached:
+            return cached
         try:
             decoded_token = auth.verify_id_token(token)
+            ttl = min(TOKEN_CACHE_TTL, decoded_token.get("exp", 0) - time.time())
+            if ttl > 0:
+                self.cache.set(cache_key, decoded_token, ttl=ttl)
             return decoded_token
         except Exception as e:
             print(f"Error verifying token: {e}")
@@ -38,31 +114,28 @@ class FirebaseService:
 
     def upload_file(self, file_bytes, destination_blob_name, content_type):
         """Uploads a file to Firebase Storage, with local fallback."""
+        # Content-hashed names never change meaning, so caches can keep them forever
+        destination_blob_name = self.media.hashed_name(file_bytes, destination_blob_name)
         try:
-            blob = self.bucket.blob(destination_blob_name)
-            blob.upload_from_string(file_bytes, content_type=content_type)
-            blob.make_public() # Optional: Make public or use signed URLs
-            return blob.public_url
+            with span("storage.upload", bytes=len(file_bytes)):
+                return self.storage_breaker.call(self._upload_blob, file_bytes, destination_blob_name, content_type)
         except Exception as e:
             print(f"Firebase upload failed: {e}. Falling back to local storage.")
-            return self.save_local(file_bytes, destination_blob_name)
+            url = self.save_local(file_bytes, destination_blob_name)
+            self._spool("file", {"name": destination_blob_name, "contentType": content_type, "url": url})
+            return url
+
+    def _upload_blob(self, file_bytes, destination_blob_name, content_type):
+        blob = self.bucket.blob(destination_blob_name)
+        blob.cache_control = IMMUTABLE_CACHE_CONTROL
+        blob.upload_from_string(file_bytes, content_type=content_type, timeout=STORAGE_TIMEOUT)
+        blob.make_public(timeout=STORAGE_TIMEOUT) # Optional: Make public or use signed URLs
+        return blob.public_url
 
     def save_local(self, file_bytes, filename):
         """Saves file locally and returns a URL."""
-        # Ensure media directory exists
-        media_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "media")
-        os.makedirs(media_path, exist_ok=True)
-        
-        # Create user directory if needed
-        full_path = os.path.join(media_path, filename)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        
-        with open(full_path, "wb") as f:
-            f.write(file_bytes)
-            
-        # Return localhost URL
-        # Assuming backend is on port 8000
-        return f"http://localhost:8000/media/{filename}"
+        with span("storage.save-local", bytes=len(file_bytes)):
+            return self.media.save(file_bytes, filename)
 
     def save_request(self, user_id, request_data):
         """Saves a request record to Firestore."""
@@ -84,11 +157,31 @@ class FirebaseService:
             'createdAt': firestore.SERVER_TIMESTAMP,
             **asset_data
         }
-        doc_ref.set(data)
+        try:
+            with span("firestore.save-asset"):
+                self.firestore_breaker.call(doc_ref.set, data)
+        except Exception as e:
+            # The id is generated client-side, so callers get it back even when the write is deferred
+            print(f"Firestore write failed: {e}. Spooling asset record.")
+            self._spool("asset", {
+                "userId": user_id,
+                "assetId": doc_ref.id,
+                "data": {**data, 'createdAt': time.time() * 1000},
+            })
+            return doc_ref.id
+        self.cache.invalidate(f"assets:{user_id}")
         return doc_ref.id
 
     def get_assets(self, user_id, asset_type=None, limit=None):
         """Retrieves assets for a user from Firestore."""
+        # A per-process cache can't see invalidations from other workers, so listings would go stale
+        cache_key = None
+        if self.cache.shared:
+            cache_key = self.cache.tagged_key(f"assets:{user_id}", f"list:{asset_type}:{limit}")
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         assets_ref = self.db.collection('users').document(user_id).collection('assets')
         
         query = assets_ref.order_by('createdAt', direction=firestore.Query.DESCENDING)
@@ -99,7 +192,8 @@ class FirebaseService:
         if limit:
             query = query.limit(int(limit))
             
-        docs = query.stream()
+        with span("firestore.get-assets"):
+            docs = self.firestore_breaker.call(lambda: list(query.stream()))
         
         assets = []
         for doc in docs:
@@ -110,9 +204,278 @@ class FirebaseService:
                 asset['createdAt'] = asset['createdAt'].timestamp() * 1000
             assets.append(asset)
             
+        if cache_key:
+            self.cache.set(cache_key, assets, ttl=ASSET_LIST_CACHE_TTL)
         return assets
     def update_asset(self, user_id, asset_id, updates):
         """Updates an asset record in Firestore."""
         doc_ref = self.db.collection('users').document(user_id).collection('assets').document(asset_id)
-        doc_ref.update(updates)
+        self.firestore_breaker.call(doc_ref.update, updates)
+        self.cache.invalidate(f"assets:{user_id}")
         return True
+
+    def delete_asset(self, user_id, asset_id):
+        """Deletes an asset record and its stored files."""
+        result = self.delete_assets(user_id, asset_ids=[asset_id])
+        return result[0]["status"] == "deleted"
+
+    def delete_assets(self, user_id, asset_ids=None, asset_type=None, older_than=None, max_workers=16):
+        """Deletes many assets: Firestore docs in batched writes, files in parallel.
+
+        Assets are selected by id, or by type and/or createdAt (ms) older than a cutoff.
+        Returns one {"id", "status"} entry per asset; status is "deleted", "not_found" or "error".
+        """
+        assets_ref = self.db.collection('users').document(user_id).collection('assets')
+
+        results = {}
+        snapshots = []
+        if asset_ids:
+            asset_ids = list(dict.fromkeys(asset_ids))
+            refs = [assets_ref.document(asset_id) for asset_id in asset_ids]
+            for doc in self.firestore_breaker.call(lambda: list(self.db.get_all(refs))):
+                if doc.exists:
+                    snapshots.append(doc)
+                else:
+                    results[doc.id] = {"id": doc.id, "status": "not_found"}
+        else:
+            query = assets_ref
+            if asset_type:
+                query = query.where('type', '==', asset_type)
+            if older_than:
+                cutoff = datetime.datetime.fromtimestamp(older_than / 1000, tz=datetime.timezone.utc)
+                query = query.where('createdAt', '<', cutoff)
+            snapshots = self.firestore_breaker.call(lambda: list(query.stream()))
+
+        # Delete records first so the library stops listing them even if file cleanup fails
+        deleted = []
+        for i in range(0, len(snapshots), FIRESTORE_BATCH_SIZE):
+            chunk = snapshots[i:i + FIRESTORE_BATCH_SIZE]
+            batch = self.db.batch()
+            for doc in chunk:
+                batch.delete(doc.reference)
+            try:
+                self.firestore_breaker.call(batch.commit)
+                deleted.extend(chunk)
+            except Exception as e:
+                print(f"Batch delete failed: {e}")
+                for doc in chunk:
+                    results[doc.id] = {"id": doc.id, "status": "error", "error": str(e)}
+
+        if deleted:
+            self.cache.invalidate(f"assets:{user_id}")
+
+        def delete_files(doc):
+            asset = doc.to_dict()
+            errors = []
+            for field in ASSET_FILE_FIELDS:
+                if asset.get(field):
+                    try:
+                        self.delete_file(user_id, asset[field])
+                    except Exception as e:
+                        errors.append(f"{field}: {e}")
+            result = {"id": doc.id, "status": "deleted"}
+            if errors:
+                result["fileErrors"] = errors
+            return result
+
+        if deleted:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for result in executor.map(delete_files, deleted):
+                    results[result["id"]] = result
+
+        ordered_ids = asset_ids or [doc.id for doc in snapshots]
+        return [results[asset_id] for asset_id in ordered_ids if asset_id in results]
+
+    def resolve_file(self, user_id, url):
+        """Maps an asset URL to ("local", path) or ("blob", name) if the file belongs to the user."""
+        # Asset URLs are client-supplied (POST /assets), so only touch files under the user's prefix
+        user_prefix = f"{user_id}/"
+        local_name = self.media.name_from_url(url)
+        if local_name:
+            if os.path.normpath(local_name).startswith(user_prefix):
+                return "local", self.media.path_for(local_name)
+            return None
+
+        blob_name = self.blob_name_from_url(url)
+        if blob_name and blob_name.startswith(user_prefix):
+            return "blob", blob_name
+        return None
+
+    def delete_file(self, user_id, url):
+        """Deletes the bucket object or local media file behind a URL, if it belongs to the user."""
+        resolved = self.resolve_file(user_id, url)
+        if resolved is None:
+            return
+        kind, location = resolved
+        try:
+            if kind == "local":
+                os.remove(location)
+            else:
+                self.bucket.blob(location).delete()
+        except (FileNotFoundError, NotFound):
+            pass
+
+    def open_file(self, user_id, url):
+        """Opens the file behind an asset URL for streaming; returns (size, reader) or None."""
+        resolved = self.resolve_file(user_id, url)
+        if resolved is None:
+            return None
+        kind, location = resolved
+        if kind == "local":
+            return os.path.getsize(location), open(location, "rb")
+
+        blob = self.bucket.get_blob(location)
+        if blob is None:
+            raise FileNotFoundError(f"Blob not found: {location}")
+        return blob.size, blob.open("rb", chunk_size=1024 * 1024)
+
+    def blob_name_from_url(self, url):
+        """Maps a public or Firebase download URL for our bucket back to the blob name."""
+        parsed = urlparse(url)
+        public_prefix = f"/{self.bucket.name}/"
+        download_prefix = f"/v0/b/{self.bucket.name}/o/"
+        if parsed.netloc == "storage.googleapis.com" and parsed.path.startswith(public_prefix):
+            return unquote(parsed.path[len(public_prefix):])
+        if parsed.netloc == "firebasestorage.googleapis.com" and parsed.path.startswith(download_prefix):
+            return unquote(parsed.path[len(download_prefix):])
+        return None
+
+    def _spool(self, kind, entry):
+        """Records a deferred write for reconcile_spool."""
+        entry = {"kind": kind, "spooledAt": time.time(), **entry}
+        path = os.path.join(SPOOL_DIR, f"{time.time_ns()}-{uuid.uuid4().hex}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(entry, f)
+        os.replace(f"{path}.tmp", path)
+        # A single failure may not open the circuit, so don't rely on on_close alone
+        self._schedule_reconcile(SPOOL_MIN_AGE + 1)
+
+    def _schedule_reconcile(self, delay):
+        timer = self.reconcile_timer
+        if timer and timer.is_alive() and timer is not threading.current_thread():
+            return
+        self.reconcile_timer = threading.Timer(delay, self.reconcile_spool)
+        self.reconcile_timer.daemon = True
+        self.reconcile_timer.start()
+
+    def reconcile_spool(self):
+        """Replays spooled uploads and asset records into Firebase once it is reachable.
+
+        Files go first so spooled asset records can point at their bucket URLs. Entries
+        are claimed by renaming, so several workers can reconcile the same spool. Entries
+        that can never succeed are moved to SPOOL_DEAD_DIR and replay carries on; any other
+        error stops the run and schedules a retry.
+        """
+        if not self.reconcile_lock.acquire(blocking=False):
+            return
+        try:
+            entries = sorted(f for f in os.listdir(SPOOL_DIR) if f.endswith(".json"))
+            deferred = False
+            for kind in ("file", "asset"):
+                for name in entries:
+                    path = os.path.join(SPOOL_DIR, name)
+                    claimed = f"{path}.{os.getpid()}.claimed"
+                    try:
+                        with open(path) as f:
+                            entry = json.load(f)
+                        if entry["kind"] != kind:
+                            continue
+                        if kind == "file" and time.time() - entry["spooledAt"] < SPOOL_MIN_AGE:
+                            deferred = True
+                            continue
+                        os.rename(path, claimed)
+                    except (FileNotFoundError, ValueError):
+                        continue  # Claimed by another worker, or half-written
+
+                    try:
+                        if kind == "file":
+                            self._reconcile_file(entry)
+                        else:
+                            self._reconcile_asset(entry)
+                        os.remove(claimed)
+                    except Exception as e:
+                        if _is_terminal_spool_error(e):
+                            print(f"Spool entry {name} can't be replayed, dead-lettering it: {e}")
+                            os.rename(claimed, os.path.join(SPOOL_DEAD_DIR, name))
+                            continue
+                        print(f"Spool reconcile failed for {name}: {e}")
+                        os.rename(claimed, path)
+                        self._schedule_reconcile(SPOOL_RETRY_DELAY)
+                        return
+            if deferred:
+                self._schedule_reconcile(SPOOL_MIN_AGE)
+            self._prune_moved()
+        finally:
+            self.reconcile_lock.release()
+
+    def _moved_path(self, local_url):
+        return os.path.join(SPOOL_MOVED_DIR, hashlib.sha256(local_url.encode()).hexdigest() + ".json")
+
+    def _record_moved(self, local_url, public_url):
+        path = self._moved_path(local_url)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"url": local_url, "publicUrl": public_url}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _moved_url(self, local_url):
+        """Returns the bucket URL a reconciled local file was moved to, or None."""
+        try:
+            with open(self._moved_path(local_url)) as f:
+                return json.load(f)["publicUrl"]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _prune_moved(self):
+        cutoff = time.time() - SPOOL_MOVED_TTL
+        for name in os.listdir(SPOOL_MOVED_DIR):
+            path = os.path.join(SPOOL_MOVED_DIR, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _reconcile_file(self, entry):
+        """Uploads a spooled file, repoints assets at the bucket copy and removes the local one."""
+        local_path = self.media.path_for(self.media.name_from_url(entry["url"]))
+        with open(local_path, "rb") as f:
+            file_bytes = f.read()
+        public_url = self.storage_breaker.call(self._upload_blob, file_bytes, entry["name"], entry["contentType"])
+        # Recorded before repointing existing records; _reconcile_asset re-checks it after writing
+        self._record_moved(entry["url"], public_url)
+
+        user_id = entry["name"].split("/", 1)[0]
+        assets_ref = self.db.collection('users').document(user_id).collection('assets')
+        for field in ASSET_FILE_FIELDS:
+            docs = self.firestore_breaker.call(lambda: list(assets_ref.where(field, '==', entry["url"]).stream()))
+            for doc in docs:
+                self.firestore_breaker.call(doc.reference.update, {field: public_url})
+        self.cache.invalidate(f"assets:{user_id}")
+
+        try:
+            os.remove(local_path)
+        except FileNotFoundError:
+            pass
+        return public_url
+
+    def _reconcile_asset(self, entry):
+        data = dict(entry["data"])
+        for field in ASSET_FILE_FIELDS:
+            if data.get(field):
+                data[field] = self._moved_url(data[field]) or data[field]
+        data['createdAt'] = datetime.datetime.fromtimestamp(data['createdAt'] / 1000, tz=datetime.timezone.utc)
+
+        user_id = entry["userId"]
+        doc_ref = self.db.collection('users').document(user_id).collection('assets').document(entry["assetId"])
+        self.firestore_breaker.call(doc_ref.set, data)
+
+        # A file reconciled concurrently may have been moved after the lookup above but
+        # before its repointing query could see this record
+        moved = {}
+        for field in ASSET_FILE_FIELDS:
+            public_url = data.get(field) and self._moved_url(data[field])
+            if public_url:
+                moved[field] = public_url
+        if moved:
+            self.firestore_breaker.call(doc_ref.update, moved)
+        self.cache.invalidate(f"assets:{user_id}")
@@ -1,16 +1,26 @@
 import os
 import io
+import functools
 from PIL import Image
-from google import genai
 from google.genai import types
+from starlette.concurrency import run_in_threadpool
+from backend.services.tracing_service import span
+from backend.services.vertex_router_service import get_router
 
-PROJECT_ID = "vital-octagon-19612"
-LOCATION = "global"
 MODEL_NAME = "gemini-2.5-flash-image"
 
+
+@functools.lru_cache(maxsize=16)
+def _blank_png(width, height, color):
+    # Only a handful of aspect ratio/resolution combinations exist, and large ones take ~0.5s to encode
+    image = Image.new("RGB", (width, height), color)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
 class GeminiService:
-    def __init__(self):
-        self.client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    def __init__(self, router=None):
+        self.router = router or get_router()
         self.config = types.GenerateContentConfig(
             temperature=1,
             top_p=0.95,
@@ -19,12 +29,9 @@ class GeminiService:
         )
 
     def create_blank_canvas(self, width: int = 1024, height: int = 1024, color: str = "white") -> types.Part:
-        image = Image.new("RGB", (width, height), color)
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        return types.Part.from_bytes(data=buffer.getvalue(), mime_type="image/png")
+        return types.Part.from_bytes(data=_blank_png(width, height, color), mime_type="image/png")
 
-    def generate_image(self, prompt: str, aspect_ratio: str = "1:1", model_name: str = "gemini-2.5-flash-image", resolution: str = "1K") -> bytes:
+    async def generate_image(self, prompt: str, aspect_ratio: str = "1:1", model_name: str = "gemini-2.5-flash-image", resolution: str = "1K") -> bytes:
         # Handle aspect ratio by creating a canvas if needed, or just prompt
         # For simplicity, if aspect ratio is standard, we might rely on model or canvas
         # The notebook uses canvas for aspect ratio control.
@@ -48,17 +55,24 @@ class GeminiService:
         width = base_width * scale_factor
         height = base_height * scale_factor
         
-        canvas = self.create_blank_canvas(width, height)
+        # Keep the PNG encode off the event loop
+        canvas = await run_in_threadpool(self.create_blank_canvas, width, height)
         
         contents = [
             types.Content(role="user", parts=[canvas, types.Part.from_text(text=prompt)])
         ]
         
-        response = self.client.models.generate_content(
-            model=model_name,
-            contents=contents,
-            config=self.config,
-        )
+        # Latency-sensitive: hedge to a second region if the first is slower than usual
+        with span("gemini.generate-content", model=model_name):
+            response = await self.router.call_async(
+                model_name,
+                lambda client: client.aio.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=self.config,
+                ),
+                hedge=True,
+            )
         
         if response.candidates and response.candidates[0].content.parts:
             for part in response.candidates[0].content.parts:
@@ -67,26 +81,36 @@ class GeminiService:
         
         raise Exception(f"No image generated. Response: {response}")
 
-    def edit_image(self, image_bytes: bytes, prompt: str, mime_type: str = "image/png", model_name: str = "gemini-2.5-flash-image") -> bytes:
-        source_image = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-        
+    def enhance_edit_prompt(self, prompt: str) -> str:
         # Enhance prompt for background change if it's not explicit
         # The frontend sends "Describe new background", so we should frame it as an instruction.
-        enhanced_prompt = f"Change the background to {prompt}" if "background" not in prompt.lower() else prompt
+        return f"Change the background to {prompt}" if "background" not in prompt.lower() else prompt
+
+    def edit_image(self, image_bytes: bytes, prompt: str, mime_type: str = "image/png", model_name: str = "gemini-2.5-flash-image") -> bytes:
+        source_image = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+        enhanced_prompt = self.enhance_edit_prompt(prompt)
         
-        contents = [
-            types.Content(role="user", parts=[source_image, types.Part.from_text(text=enhanced_prompt)])
-        ]
+        image_bytes, _ = self.edit_turn([], [source_image, types.Part.from_text(text=enhanced_prompt)], model_name)
+        return image_bytes
+
+    def edit_turn(self, history: list, parts: list, model_name: str = "gemini-2.5-flash-image"):
+        """Runs one turn of a (possibly multi-turn) edit; returns (image_bytes, model_content)."""
+        contents = history + [types.Content(role="user", parts=parts)]
         
-        response = self.client.models.generate_content(
-            model=model_name,
-            contents=contents,
-            config=self.config,
-        )
+        with span("gemini.generate-content", model=model_name):
+            response = self.router.call(
+                model_name,
+                lambda client: client.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=self.config,
+                ),
+            )
         
         if response.candidates and response.candidates[0].content.parts:
-            for part in response.candidates[0].content.parts:
+            content = response.candidates[0].content
+            for part in content.parts:
                 if part.inline_data and part.inline_data.data:
-                    return part.inline_data.data
+                    return part.inline_data.data, content
                     
         raise Exception("No image generated")
@@ -1,13 +1,11 @@
 import os
-from google import genai
 from google.genai import types
-
-PROJECT_ID = "vital-octagon-19612"
-LOCATION = "global"
+from backend.services.tracing_service import span
+from backend.services.vertex_router_service import get_router
 
 class GeminiTextService:
-    def __init__(self):
-        self.client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    def __init__(self, router=None):
+        self.router = router or get_router()
 
     def generate_text(
         self,
@@ -29,10 +27,14 @@ class GeminiTextService:
             system_instruction=system_instruction
         )
         
-        response = self.client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config=config,
-        )
+        with span("gemini.generate-text", model=model):
+            response = self.router.call(
+                model,
+                lambda client: client.models.generate_content(
+                    model=model,
+                    contents=prompt,
+                    config=config,
+                ),
+            )
         
         return response.text
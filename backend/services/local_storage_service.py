@@ -2,11 +2,13 @@ import os
 import json
 import time
 from pathlib import Path
+from backend.services.media_service import MediaService, MEDIA_BASE_URL
 
 class LocalStorageService:
-    def __init__(self, base_url="http://localhost:8000"):
+    def __init__(self, base_url=MEDIA_BASE_URL):
         self.base_url = base_url
-        self.media_dir = Path("media")
+        self.media = MediaService(base_url=base_url)
+        self.media_dir = Path(self.media.media_dir)
         self.data_dir = Path("data")
         
         # Ensure directories exist
@@ -30,13 +32,7 @@ class LocalStorageService:
     def upload_file(self, file_bytes, destination_blob_name, content_type):
         """Uploads a file to the local media directory."""
         # destination_blob_name might contain folders (e.g. "user_id/uuid.png")
-        file_path = self.media_dir / destination_blob_name
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-            
-        return f"{self.base_url}/media/{destination_blob_name}"
+        return self.media.save(file_bytes, destination_blob_name)
 
     def _get_user_file(self, user_id, file_type):
         user_dir = self.data_dir / user_id
@@ -109,3 +105,43 @@ class LocalStorageService:
             
         self._write_json(file_path, new_assets)
         return True
+
+    def delete_assets(self, user_id, asset_ids=None, asset_type=None, older_than=None):
+        """Deletes many asset records and their local media files."""
+        file_path = self._get_user_file(user_id, "assets")
+        assets = self._read_json(file_path)
+
+        def selected(asset):
+            if asset_ids:
+                return str(asset.get('id')) in {str(i) for i in asset_ids}
+            if asset_type and asset.get('type') != asset_type:
+                return False
+            if older_than and asset.get('createdAt', 0) >= older_than:
+                return False
+            return True
+
+        removed = [a for a in assets if selected(a)]
+        self._write_json(file_path, [a for a in assets if not selected(a)])
+
+        for asset in removed:
+            for field in ("url", "posterUrl"):
+                name = self.media.name_from_url(asset.get(field) or "")
+                if name and os.path.normpath(name).startswith(f"{user_id}/"):
+                    try:
+                        os.remove(self.media.path_for(name))
+                    except FileNotFoundError:
+                        pass
+
+        results = [{"id": str(a['id']), "status": "deleted"} for a in removed]
+        if asset_ids:
+            removed_ids = {r["id"] for r in results}
+            results += [{"id": str(i), "status": "not_found"} for i in asset_ids if str(i) not in removed_ids]
+        return results
+
+    def open_file(self, user_id, url):
+        """Opens a local media file behind an asset URL; returns (size, reader) or None."""
+        name = self.media.name_from_url(url)
+        if not name or not os.path.normpath(name).startswith(f"{user_id}/"):
+            return None
+        path = self.media.path_for(name)
+        return os.path.getsize(path), open(path, "rb")
@@ -0,0 +1,92 @@
+import os
+import re
+import hashlib
+import uuid
+from urllib.parse import urlparse
+from fastapi.staticfiles import StaticFiles
+from starlette.staticfiles import NotModifiedResponse
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+
+MEDIA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "media")
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://localhost:8000")
+MEDIA_ROUTE = "/media"
+
+# Length of the content hash embedded in file names, e.g. "abc_tryon.<hash>.jpg"
+HASH_LENGTH = 20
+HASHED_NAME_RE = re.compile(r"\.([0-9a-f]{%d})\.[A-Za-z0-9]+$" % HASH_LENGTH)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+class MediaService:
+    def __init__(self, media_dir: str = MEDIA_DIR, base_url: str = MEDIA_BASE_URL):
+        self.media_dir = media_dir
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.media_dir, exist_ok=True)
+
+    def hashed_name(self, file_bytes: bytes, filename: str) -> str:
+        """Embeds a content hash in the file name so the path never changes meaning."""
+        if HASHED_NAME_RE.search(filename):
+            return filename
+        digest = hashlib.sha256(file_bytes).hexdigest()[:HASH_LENGTH]
+        root, ext = os.path.splitext(filename)
+        return f"{root}.{digest}{ext}"
+
+    def path_for(self, filename: str) -> str:
+        """Resolves a media-relative name to a path inside the media directory."""
+        full_path = os.path.realpath(os.path.join(self.media_dir, filename))
+        if not full_path.startswith(os.path.realpath(self.media_dir) + os.sep):
+            raise ValueError(f"Invalid media path: {filename}")
+        return full_path
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.base_url}{MEDIA_ROUTE}/{filename}"
+
+    def name_from_url(self, url: str):
+        """Returns the media-relative name for a URL served by this backend, else None."""
+        path = urlparse(url).path
+        prefix = MEDIA_ROUTE + "/"
+        if not path.startswith(prefix):
+            return None
+        return path[len(prefix):]
+
+    def save(self, file_bytes: bytes, filename: str) -> str:
+        """Saves file under its content-hashed name and returns its URL."""
+        name = self.hashed_name(file_bytes, filename)
+        full_path = self.path_for(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        # Content-addressed: an existing file with this name already has these bytes
+        if not os.path.exists(full_path):
+            tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(file_bytes)
+            os.replace(tmp_path, full_path)
+
+        return self.url_for(name)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles with long-lived caching for content-hashed media.
+
+    Files whose name carries a content hash get the hash as a strong ETag and
+    `Cache-Control: immutable`; anything else must be revalidated. Byte ranges
+    (video seeking) and `http.response.pathsend` zero-copy sends are handled by
+    Starlette's FileResponse.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        headers = {"cache-control": REVALIDATE_CACHE_CONTROL}
+        match = HASHED_NAME_RE.search(os.fspath(full_path))
+        if match:
+            headers = {
+                "cache-control": IMMUTABLE_CACHE_CONTROL,
+                "etag": f'"{match.group(1)}"',
+            }
+
+        response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+
+from backend.services.tracing_service import span
+
+MEMORY_BUDGET_BYTES = int(os.getenv("MEMORY_BUDGET_MB", "1024")) * 1024 * 1024
+# How long admission may wait for budget before giving up with a 503
+MEMORY_BUDGET_QUEUE_TIMEOUT = float(os.getenv("MEMORY_BUDGET_QUEUE_TIMEOUT", "10"))
+MEMORY_BUDGET_MAX_QUEUE = int(os.getenv("MEMORY_BUDGET_MAX_QUEUE", "64"))
+# Reserved for requests that don't send Content-Length
+DEFAULT_REQUEST_ESTIMATE = 8 * 1024 * 1024
+
+_current_reservation = contextvars.ContextVar("current_reservation", default=None)
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Server is busy, memory budget exhausted")
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """Bytes held against the budget by one request, including results kept for background work."""
+
+    def __init__(self, budget, nbytes):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.released = False
+
+    def add(self, nbytes):
+        """Accounts for bytes produced after admission (e.g. a model result). Never blocks."""
+        self.budget._force_acquire(nbytes)
+        self.nbytes += nbytes
+
+    def try_add(self, nbytes):
+        """Grows the reservation only if the budget has room right now; returns whether it did."""
+        if not self.budget._try_acquire(nbytes):
+            return False
+        self.nbytes += nbytes
+        return True
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.budget.release(self.nbytes)
+
+
+class MemoryBudget:
+    """Process-wide limit on bytes held by in-flight media requests.
+
+    Admission is FIFO: a request waits until its bytes fit (a request larger than the whole
+    budget is admitted only when nothing else is held), or fails after `queue_timeout`.
+    """
+
+    def __init__(self, limit_bytes=MEMORY_BUDGET_BYTES, queue_timeout=MEMORY_BUDGET_QUEUE_TIMEOUT,
+                 max_queue=MEMORY_BUDGET_MAX_QUEUE):
+        self.limit = limit_bytes
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.used = 0
+        self.peak = 0
+        self.waiters = deque()
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def _fits(self, nbytes):
+        return self.used + nbytes <= self.limit or self.used == 0
+
+    def _take(self, nbytes):
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+
+    def _force_acquire(self, nbytes):
+        with self.lock:
+            self._take(nbytes)
+
+    def _try_acquire(self, nbytes):
+        with self.lock:
+            if self.used + nbytes > self.limit:
+                self.rejected += 1
+                return False
+            self._take(nbytes)
+            return True
+
+    async def acquire(self, nbytes):
+        """Waits for nbytes of budget and returns a Reservation, or raises BudgetExceeded."""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if not self.waiters and self._fits(nbytes):
+                self._take(nbytes)
+                self.admitted += 1
+                return Reservation(self, nbytes)
+            if len(self.waiters) >= self.max_queue:
+                self.rejected += 1
+                raise BudgetExceeded(max(1, int(self.queue_timeout)))
+            entry = (nbytes, loop.create_future(), loop)
+            self.waiters.append(entry)
+            self.queued += 1
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(entry[1], self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self.lock:
+                granted = entry not in self.waiters
+                if not granted:
+                    self.waiters.remove(entry)
+                    self.rejected += isinstance(e, asyncio.TimeoutError)
+            if granted:
+                # Budget was handed over just as we gave up; give it back
+                self.release(nbytes)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise BudgetExceeded(max(1, int(self.queue_timeout)))
+        finally:
+            with self.lock:
+                self.wait_seconds += time.monotonic() - started
+
+        with self.lock:
+            self.admitted += 1
+        return Reservation(self, nbytes)
+
+    def release(self, nbytes):
+        """Returns bytes to the budget and admits queued requests that now fit. Thread-safe."""
+        with self.lock:
+            self.used -= nbytes
+            while self.waiters and self._fits(self.waiters[0][0]):
+                waiter_bytes, future, loop = self.waiters.popleft()
+                self._take(waiter_bytes)
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "limitBytes": self.limit,
+                "usedBytes": self.used,
+                "peakBytes": self.peak,
+                "utilization": round(self.used / self.limit, 3) if self.limit else None,
+                "queuedNow": len(self.waiters),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "waitSeconds": round(self.wait_seconds, 3),
+            }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def track_bytes(nbytes):
+    """Adds bytes produced while handling the current request (e.g. a model result) to its reservation."""
+    reservation = _current_reservation.get()
+    if reservation is not None:
+        reservation.add(nbytes)
+
+
+class MemoryBudgetMiddleware:
+    """ASGI middleware that admits requests to `paths` (or below them) only when the budget has room.
+
+    A request reserves its Content-Length on admission (a guess if it has none); endpoints
+    add result sizes with `track_bytes`. The body is counted as it arrives, and a request
+    that outgrows its reservation must top it up from the free budget or gets a 503.
+    Everything is released once the response and its background tasks finish.
+    """
+
+    def __init__(self, app, budget, paths):
+        self.app = app
+        self.budget = budget
+        self.paths = tuple(paths)
+
+    def _matches(self, path):
+        return any(path == p or path.startswith(p + "/") for p in self.paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._matches(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            nbytes = int(headers.get(b"content-length", b""))
+        except ValueError:
+            nbytes = DEFAULT_REQUEST_ESTIMATE
+
+        try:
+            with span("budget-wait", bytes=nbytes):
+                reservation = await self.budget.acquire(nbytes)
+        except BudgetExceeded as e:
+            await self._reject(send, e)
+            return
+
+        received = 0
+        exceeded = None
+        started = False
+
+        async def counting_receive():
+            # Content-Length may be missing (chunked uploads), so count what actually arrives
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > reservation.nbytes:
+                    top_up = max(received - reservation.nbytes, DEFAULT_REQUEST_ESTIMATE)
+                    if not reservation.try_add(top_up):
+                        exceeded = BudgetExceeded(max(1, int(self.budget.queue_timeout)))
+                        raise exceeded
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded is not None:
+                return  # Whatever error response the app made of it is replaced by the 503 below
+            started = True
+            await send(message)
+
+        token = _current_reservation.set(reservation)
+        try:
+            # Starlette runs background tasks before the app returns, so their bytes are covered too
+            await self.app(scope, counting_receive, guarded_send)
+        except BudgetExceeded:
+            if started:
+                raise
+        finally:
+            _current_reservation.reset(token)
+            reservation.release()
+
+        if exceeded is not None and not started:
+            await self._reject(send, exceeded)
+
+    async def _reject(self, send, error):
+        body = json.dumps({"detail": str(error)}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(error.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import secrets
+import functools
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SERVICE_NAME = "banana-fashion-backend"
+# Where finished traces go, as OTLP/JSON: a local file (one export request per line) and/or a collector URL
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+TRACE_EXPORT_URL = os.getenv("TRACE_EXPORT_URL")  # e.g. http://localhost:4318/v1/traces
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self.kind = 1  # OTLP SPAN_KIND_INTERNAL
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans recorded for one unit of work: a request, or a background task it scheduled."""
+
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.parent_id = parent_id
+        self.spans = []
+
+    def server_timing(self):
+        """Renders finished spans as a Server-Timing header value, summing repeated names."""
+        totals = {}
+        for s in self.spans:
+            if s.end_ns is not None:
+                totals[s.name] = totals.get(s.name, 0) + s.duration_ms
+        return ", ".join(f"{name};dur={dur:.1f}" for name, dur in totals.items())
+
+
+def parse_traceparent(header):
+    """Returns (trace_id, parent_span_id) from a W3C traceparent header, or (None, None)."""
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+def start_trace(trace_id=None, parent_id=None):
+    """Makes a new trace current for this context and returns it with a reset token."""
+    trace = Trace(trace_id, parent_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the enclosed block as a child of the current span. No-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    s = Span(name, trace.trace_id, parent.span_id if parent else trace.parent_id, attributes)
+    trace.spans.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = str(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def traced_task(name, func):
+    """Wraps a background task so it is recorded under the trace of the request that scheduled it."""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    if trace is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        task_trace, token = start_trace(trace.trace_id, parent.span_id if parent else trace.parent_id)
+        span_token = _current_span.set(None)
+        try:
+            with span(name, background=True):
+                return func(*args, **kwargs)
+        finally:
+            _current_span.reset(span_token)
+            end_trace(token)
+            export_trace(task_trace)
+
+    return wrapper
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace):
+    """Converts a trace to an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "backend.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+def _write_export(payload):
+    try:
+        if TRACE_EXPORT_FILE:
+            with open(TRACE_EXPORT_FILE, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+        if TRACE_EXPORT_URL:
+            requests.post(TRACE_EXPORT_URL, json=payload, timeout=5)
+    except Exception as e:
+        print(f"Trace export failed: {e}")
+
+
+def export_trace(trace):
+    """Hands a finished trace to the exporter thread, if exporting is configured."""
+    if trace.spans and (TRACE_EXPORT_FILE or TRACE_EXPORT_URL):
+        _export_executor.submit(_write_export, to_otlp(trace))
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces each HTTP request.
+
+    Adds a `Server-Timing` header (one entry per span name, plus `receive-body` and
+    `total`) and exports the finished trace. Honors an incoming W3C `traceparent`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        trace, token = start_trace(trace_id, parent_id)
+
+        with span("total", method=scope["method"], path=scope["path"]) as root:
+            root.kind = 2  # OTLP SPAN_KIND_SERVER
+            body_span = None
+
+            async def traced_receive():
+                nonlocal body_span
+                if body_span is None:
+                    body_span = Span("receive-body", trace.trace_id, root.span_id)
+                    trace.spans.append(body_span)
+                message = await receive()
+                if message["type"] == "http.request" and not message.get("more_body", False):
+                    body_span.end_ns = body_span.end_ns or time.time_ns()
+                return message
+
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    root.attributes["status_code"] = message["status"]
+                    timing = trace.server_timing()
+                    timing = f"{timing}, total;dur={root.duration_ms:.1f}" if timing else f"total;dur={root.duration_ms:.1f}"
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timing.encode("latin-1")),
+                        (b"x-trace-id", trace.trace_id.encode("latin-1")),
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, traced_receive, traced_send)
+            finally:
+                end_trace(token)
+
+        export_trace(trace)
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+import httpx
+from google import genai
+from google.genai import errors as genai_errors
+
+from backend.services.tracing_service import span
+
+PROJECT_ID = os.getenv("VERTEX_PROJECT", "vital-octagon-19612")
+LOCATION = os.getenv("VERTEX_LOCATION", "global")
+# Endpoint pool per model, e.g. {"*": [{"project": "p", "location": "us-central1"}, {"project": "p", "location": "europe-west4"}]}
+VERTEX_ENDPOINTS = os.getenv("VERTEX_ENDPOINTS")
+VERTEX_HEDGE = os.getenv("VERTEX_HEDGE", "1") == "1"
+
+# Until enough samples exist, hedge after this long
+DEFAULT_HEDGE_DELAY = 8.0
+MIN_HEDGE_DELAY = 0.5
+MIN_HEDGE_SAMPLES = 20
+EWMA_ALPHA = 0.2
+# An endpoint that always fails scores this many times worse than its latency alone
+ERROR_PENALTY = 10
+
+
+def _is_request_error(error):
+    """True for 4xx rejections (other than timeouts and rate limits) that any region would repeat."""
+    return isinstance(error, genai_errors.ClientError) and error.code not in (408, 429)
+
+
+class EndpointStats:
+    """Observed latency and error rate of one model on one project/region."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=200)
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self.lock:
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA * (1.0 if error else 0.0)
+            if latency is not None:
+                self.latencies.append(latency)
+                self.ewma_latency = latency if self.ewma_latency is None else (
+                    (1 - EWMA_ALPHA) * self.ewma_latency + EWMA_ALPHA * latency
+                )
+
+    def record_censored(self, elapsed):
+        """Records a call abandoned after `elapsed` seconds, which only says its latency is longer.
+
+        It can raise the EWMA but never lower it, and stays out of the p95 samples.
+        """
+        with self.lock:
+            if self.ewma_latency is None:
+                self.ewma_latency = elapsed
+            elif elapsed > self.ewma_latency:
+                self.ewma_latency = (1 - EWMA_ALPHA) * self.ewma_latency + EWMA_ALPHA * elapsed
+
+    def score(self):
+        # Untried endpoints score 0 so each one gets measured; ones that have only failed rank last
+        latency = self.ewma_latency
+        if latency is None:
+            latency = DEFAULT_HEDGE_DELAY if self.error_rate else 0.0
+        return latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def snapshot(self):
+        return {
+            "ewmaLatency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "errorRate": round(self.error_rate, 3),
+            "samples": len(self.latencies),
+        }
+
+
+class VertexRouter:
+    """Routes model calls across a pool of project/region endpoints.
+
+    Endpoints are ranked per model by EWMA latency weighted by error rate. A failed call
+    is retried once on the next endpoint, unless the request itself was rejected (4xx),
+    which is raised as is and doesn't count against the endpoint. `call_async(..., hedge=True)` also sends a
+    second request to the runner-up once the first has taken longer than the observed
+    p95 latency, keeps whichever answers first and cancels the other.
+    `client_factory(project, location)` can be replaced with stand-in clients in tests.
+    """
+
+    def __init__(self, endpoints=None, client_factory=None, hedge=VERTEX_HEDGE):
+        if endpoints is None:
+            endpoints = json.loads(VERTEX_ENDPOINTS) if VERTEX_ENDPOINTS else {
+                "*": [{"project": PROJECT_ID, "location": LOCATION}]
+            }
+        self.endpoints = {model: [(e["project"], e["location"]) for e in pool] for model, pool in endpoints.items()}
+        self.client_factory = client_factory or (
+            lambda project, location: genai.Client(vertexai=True, project=project, location=location)
+        )
+        self.hedge = hedge
+        self.clients = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def client(self, endpoint):
+        with self.lock:
+            if endpoint not in self.clients:
+                self.clients[endpoint] = self.client_factory(*endpoint)
+            return self.clients[endpoint]
+
+    def _stats(self, model, endpoint):
+        with self.lock:
+            return self.stats.setdefault((model, endpoint), EndpointStats())
+
+    def ranked(self, model):
+        """Endpoints for model, best first."""
+        pool = self.endpoints.get(model) or self.endpoints["*"]
+        return sorted(pool, key=lambda endpoint: self._stats(model, endpoint).score())
+
+    def hedge_delay(self, model):
+        """p95 of recent successful latencies for model across its endpoints."""
+        samples = sorted(
+            latency
+            for endpoint in (self.endpoints.get(model) or self.endpoints["*"])
+            for latency in self._stats(model, endpoint).latencies
+        )
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(MIN_HEDGE_DELAY, samples[int(0.95 * (len(samples) - 1))])
+
+    def call(self, model, fn, failover=True):
+        """Runs fn(client) on the best endpoint, failing over once. Returns fn's result.
+
+        Pass failover=False for calls that aren't safe to repeat (e.g. starting a billable
+        job): they are only retried elsewhere if the first endpoint couldn't be reached.
+        """
+        last_error = None
+        for endpoint in self.ranked(model)[:2]:
+            started = time.monotonic()
+            try:
+                result = fn(self.client(endpoint))
+            except Exception as e:
+                if _is_request_error(e):
+                    raise
+                self._stats(model, endpoint).record(None, error=True)
+                print(f"Vertex call to {model} in {endpoint[1]} failed: {e}")
+                if not failover and not isinstance(e, httpx.ConnectError):
+                    raise
+                last_error = e
+                continue
+            self._stats(model, endpoint).record(time.monotonic() - started)
+            return result
+        raise last_error
+
+    async def _attempt(self, model, endpoint, fn):
+        # Cancellation records nothing here; call_async censors hedge losers itself
+        started = time.monotonic()
+        try:
+            result = await fn(self.client(endpoint))
+        except Exception as e:
+            if not _is_request_error(e):
+                self._stats(model, endpoint).record(None, error=True)
+            raise
+        self._stats(model, endpoint).record(time.monotonic() - started)
+        return result
+
+    async def call_async(self, model, fn, hedge=False):
+        """Awaits fn(client) on the best endpoint, optionally hedging to the runner-up."""
+        endpoints = self.ranked(model)
+        primary = asyncio.ensure_future(self._attempt(model, endpoints[0], fn))
+        tasks = [primary]
+        started = [time.monotonic()]
+        try:
+            if len(endpoints) < 2:
+                return await primary
+
+            delay = self.hedge_delay(model) if hedge and self.hedge else None
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done and not primary.exception():
+                return primary.result()
+            if done and _is_request_error(primary.exception()):
+                raise primary.exception()
+
+            # Primary failed, or is slower than p95: race it against the next endpoint
+            with span("vertex.failover" if done else "vertex.hedge", location=endpoints[1][1]):
+                tasks.append(asyncio.ensure_future(self._attempt(model, endpoints[1], fn)))
+                started.append(time.monotonic())
+                pending = {t for t in tasks if not t.done()}
+                last_error = primary.exception() if done else None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            self._censor_losers(model, endpoints, tasks, started)
+                            return task.result()
+                        if _is_request_error(task.exception()):
+                            raise task.exception()
+                        last_error = task.exception()
+                raise last_error
+        finally:
+            # Cancel the hedge loser, or everything if our caller went away (recording nothing)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _censor_losers(self, model, endpoints, tasks, started):
+        """Records still-running attempts as slower than the time they have taken so far."""
+        now = time.monotonic()
+        for endpoint, task, task_started in zip(endpoints, tasks, started):
+            if not task.done():
+                self._stats(model, endpoint).record_censored(now - task_started)
+
+    def status(self):
+        with self.lock:
+            return {
+                f"{model}@{project}/{location}": stats.snapshot()
+                for (model, (project, location)), stats in self.stats.items()
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Returns the process-wide router configured from VERTEX_ENDPOINTS."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = VertexRouter()
+        return _router
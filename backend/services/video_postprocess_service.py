@@ -0,0 +1,154 @@
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from backend.services.tracing_service import span
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+
+# Boxes inside moov that only contain other boxes (sample tables live under stbl)
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf", b"mvex"}
+
+
+def _iter_boxes(data, start=0, end=None):
+    """Yields (type, box_start, payload_start, box_end) for boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        payload = pos + 8
+        if size == 1:
+            if pos + 16 > end:
+                break
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            payload = pos + 16
+        elif size == 0:
+            size = end - pos
+        if size < payload - pos or pos + size > end:
+            raise ValueError(f"Truncated or malformed MP4 box {box_type!r} at {pos}")
+        yield box_type, pos, payload, pos + size
+        pos += size
+
+
+def _shift_chunk_offsets(moov, start, end, shift_from, shift_to, delta):
+    """Adds delta to every stco/co64 chunk offset in [shift_from, shift_to)."""
+    for box_type, _, payload, box_end in _iter_boxes(moov, start, end):
+        if box_type in CONTAINER_BOXES:
+            _shift_chunk_offsets(moov, payload, box_end, shift_from, shift_to, delta)
+        elif box_type in (b"stco", b"co64"):
+            fmt = ">I" if box_type == b"stco" else ">Q"
+            width = struct.calcsize(fmt)
+            count = struct.unpack_from(">I", moov, payload + 4)[0]
+            for i in range(count):
+                pos = payload + 8 + i * width
+                offset = struct.unpack_from(fmt, moov, pos)[0]
+                if shift_from <= offset < shift_to:
+                    offset += delta
+                    if box_type == b"stco" and offset > 0xFFFFFFFF:
+                        raise ValueError("Chunk offset overflows stco; co64 rewrite not supported")
+                    struct.pack_into(fmt, moov, pos, offset)
+
+
+def _find_box(data, path, start=0, end=None):
+    """Returns (payload_start, box_end) of the first box along path, e.g. [b"moov", b"mvhd"]."""
+    for box_type, _, payload, box_end in _iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            return _find_box(data, path[1:], payload, box_end)
+    return None
+
+
+class VideoPostProcessService:
+    def faststart(self, video_bytes: bytes) -> bytes:
+        """Moves the moov atom ahead of mdat so playback can start before the download ends."""
+        boxes = list(_iter_boxes(video_bytes))
+        types = [b[0] for b in boxes]
+        if b"moov" not in types or b"mdat" not in types:
+            raise ValueError("Not an MP4 file (missing moov or mdat)")
+
+        moov_index = types.index(b"moov")
+        mdat_index = types.index(b"mdat")
+        if moov_index < mdat_index:
+            return video_bytes  # Already faststart
+
+        _, moov_start, _, moov_end = boxes[moov_index]
+        mdat_start = boxes[mdat_index][1]
+        moov = bytearray(video_bytes[moov_start:moov_end])
+
+        # Everything between the first mdat and the old moov position moves forward by len(moov)
+        _shift_chunk_offsets(moov, 0, len(moov), mdat_start, moov_start, len(moov))
+
+        return b"".join([
+            video_bytes[:mdat_start],
+            bytes(moov),
+            video_bytes[mdat_start:moov_start],
+            video_bytes[moov_end:],
+        ])
+
+    def probe(self, video_bytes: bytes) -> dict:
+        """Reads duration (seconds) and video dimensions from the moov atom."""
+        info = {"duration": None, "width": None, "height": None}
+
+        mvhd = _find_box(video_bytes, [b"moov", b"mvhd"])
+        if mvhd:
+            payload = mvhd[0]
+            if video_bytes[payload] == 1:
+                timescale, duration = struct.unpack_from(">IQ", video_bytes, payload + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", video_bytes, payload + 12)
+            if timescale:
+                info["duration"] = round(duration / timescale, 3)
+
+        moov = _find_box(video_bytes, [b"moov"])
+        if moov:
+            for box_type, _, payload, box_end in _iter_boxes(video_bytes, *moov):
+                if box_type != b"trak":
+                    continue
+                tkhd = _find_box(video_bytes, [b"tkhd"], payload, box_end)
+                if not tkhd:
+                    continue
+                # width/height are 16.16 fixed point at the end of tkhd
+                dims_at = tkhd[0] + (88 if video_bytes[tkhd[0]] == 1 else 76)
+                width, height = struct.unpack_from(">II", video_bytes, dims_at)
+                if width and height:
+                    info["width"] = width >> 16
+                    info["height"] = height >> 16
+                    break
+
+        return info
+
+    def extract_poster(self, video_bytes: bytes, at_seconds: float = 0.0) -> bytes:
+        """Grabs a single JPEG frame using ffmpeg. Returns None if ffmpeg is unavailable or fails."""
+        if not FFMPEG_PATH:
+            return None
+
+        # The poster is optional, so any failure here just means the asset is saved without one
+        try:
+            with span("mp4.poster"), tempfile.NamedTemporaryFile(suffix=".mp4") as tmp:
+                tmp.write(video_bytes)
+                tmp.flush()
+                result = subprocess.run(
+                    [FFMPEG_PATH, "-v", "error", "-ss", f"{at_seconds:.3f}", "-i", tmp.name,
+                     "-frames:v", "1", "-q:v", "3", "-f", "image2", "-c:v", "mjpeg", "pipe:1"],
+                    capture_output=True,
+                    timeout=30,
+                )
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"Poster extraction failed: {e}")
+            return None
+        if result.returncode != 0 or not result.stdout:
+            print(f"Poster extraction failed: {result.stderr.decode(errors='replace')}")
+            return None
+        return result.stdout
+
+    def process(self, video_bytes: bytes):
+        """Rewrites to faststart and returns (video_bytes, metadata)."""
+        try:
+            with span("mp4.faststart", bytes=len(video_bytes)):
+                video_bytes = self.faststart(video_bytes)
+                return video_bytes, self.probe(video_bytes)
+        except (ValueError, struct.error) as e:
+            print(f"MP4 post-processing skipped: {e}")
+            return video_bytes, {"duration": None, "width": None, "height": None}
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from backend.services.cache_service import MemoryCache, SQLiteCache, RedisCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_redis(max_entries=100):
+    return RedisCache(client=fakeredis.FakeRedis(), max_entries=max_entries)
+
+
+def test_redis_get_set_roundtrip():
+    cache = make_redis()
+    cache.set("token:abc", {"uid": "u1"})
+    assert cache.get("token:abc") == {"uid": "u1"}
+    assert cache.get("missing", "fallback") == "fallback"
+
+
+def test_redis_ttl_expires():
+    cache = make_redis()
+    cache.set("short", 1, ttl=0.05)
+    assert cache.get("short") == 1
+    time.sleep(0.1)
+    assert cache.get("short") is None
+
+
+def test_redis_invalidate_is_seen_by_other_workers():
+    server = fakeredis.FakeServer()
+    worker_a = RedisCache(client=fakeredis.FakeRedis(server=server))
+    worker_b = RedisCache(client=fakeredis.FakeRedis(server=server))
+
+    key = worker_a.tagged_key("assets:u1", "list:None:None")
+    worker_a.set(key, ["old"])
+    assert worker_b.get(worker_b.tagged_key("assets:u1", "list:None:None")) == ["old"]
+
+    worker_b.invalidate("assets:u1")
+    assert worker_a.get(worker_a.tagged_key("assets:u1", "list:None:None")) is None
+
+
+def test_redis_evicts_least_recently_used():
+    cache = make_redis(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_redis_eviction_keeps_tag_versions():
+    cache = make_redis(max_entries=1)
+    cache.invalidate("assets:u1")
+    stale_key = cache.tagged_key("assets:u1", "list")
+    cache.invalidate("assets:u1")
+    for i in range(5):
+        cache.set(f"filler:{i}", i)
+    assert cache.tagged_key("assets:u1", "list") != stale_key
+
+
+def test_sqlite_invalidate_is_seen_by_other_workers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    worker_a = SQLiteCache(path)
+    worker_b = SQLiteCache(path)
+
+    worker_a.set(worker_a.tagged_key("assets:u1", "list"), ["old"])
+    worker_b.invalidate("assets:u1")
+    assert worker_a.get(worker_a.tagged_key("assets:u1", "list")) is None
+
+
+def test_only_memory_cache_is_unshared(tmp_path):
+    assert MemoryCache.shared is False
+    assert SQLiteCache(str(tmp_path / "cache.sqlite3")).shared is True
+    assert make_redis().shared is True
+
+
+def test_sqlite_hits_do_not_write(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("token:abc", {"uid": "u1"}, ttl=300)
+    conn = cache._conn()
+    before = conn.total_changes
+    for _ in range(10):
+        assert cache.get("token:abc") == {"uid": "u1"}
+    assert conn.total_changes == before
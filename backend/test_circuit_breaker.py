@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from backend.services.circuit_breaker_service import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+class NotFoundError(Exception):
+    pass
+
+
+def fail():
+    raise RuntimeError("down")
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    assert breaker.state == OPEN
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", probe=lambda: None, failure_threshold=3, recovery_timeout=60)
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    breaker.call(lambda: "ok")  # A success resets the count
+    open_breaker(breaker)
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.call(lambda: "ok")
+    assert excinfo.value.retry_after >= 1
+
+
+def test_excluded_exceptions_do_not_count():
+    breaker = CircuitBreaker("test", probe=lambda: None, failure_threshold=2, excluded_exceptions=(NotFoundError,))
+
+    def missing():
+        raise NotFoundError()
+
+    for _ in range(5):
+        with pytest.raises(NotFoundError):
+            breaker.call(missing)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probe_success_closes_and_runs_on_close():
+    closed = []
+    breaker = CircuitBreaker(
+        "test", probe=lambda: None, failure_threshold=2, recovery_timeout=0, on_close=lambda: closed.append(True)
+    )
+    open_breaker(breaker)
+
+    # The first call after recovery_timeout starts the probe but is still refused
+    assert breaker.allow() is False
+    wait_for(lambda: breaker.state == CLOSED)
+    assert closed == [True]
+    assert breaker.failures == 0
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = CircuitBreaker("test", probe=fail, failure_threshold=2, recovery_timeout=0)
+    open_breaker(breaker)
+    opened_at = breaker.opened_at
+
+    assert breaker.allow() is False
+    wait_for(lambda: breaker.state == OPEN and breaker.opened_at != opened_at)
+    assert breaker.last_error == "down"
+
+
+def test_only_one_probe_while_half_open():
+    probes = []
+    breaker = CircuitBreaker("test", probe=lambda: probes.append(True) or time.sleep(0.1), failure_threshold=1,
+                             recovery_timeout=0)
+    open_breaker(breaker)
+    for _ in range(10):
+        breaker.allow()
+    assert breaker.state in (HALF_OPEN, CLOSED)
+    wait_for(lambda: breaker.state == CLOSED)
+    assert len(probes) == 1
+
+
+def test_on_close_errors_are_contained():
+    def broken():
+        raise RuntimeError("reconcile failed")
+
+    breaker = CircuitBreaker("test", probe=lambda: None, failure_threshold=1, recovery_timeout=0, on_close=broken)
+    open_breaker(breaker)
+    breaker.allow()
+    wait_for(lambda: breaker.state == CLOSED)
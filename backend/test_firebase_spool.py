@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+from google.api_core.exceptions import Forbidden, TooManyRequests
+
+from backend.services import firebase_service
+from backend.services.cache_service import MemoryCache
+from backend.services.circuit_breaker_service import CircuitBreaker
+from backend.services.firebase_service import FirebaseService
+from backend.services.media_service import MediaService
+
+
+class FakeDoc:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.id = doc_id
+        self.reference = self
+
+    def set(self, data):
+        self.store[self.id] = dict(data)
+
+    def update(self, data):
+        self.store[self.id].update(data)
+
+
+class FakeQuery:
+    def __init__(self, store, field, value):
+        self.store, self.field, self.value = store, field, value
+
+    def stream(self):
+        return [FakeDoc(self.store, i) for i, d in self.store.items() if d.get(self.field) == self.value]
+
+
+class FakeCollection:
+    """Just enough of users/{uid}/assets for the spool replay."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return self if doc_id == "u1" else FakeDoc(self.store, doc_id)
+
+    def where(self, field, op, value):
+        return FakeQuery(self.store, field, value)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    spool = tmp_path / "spool"
+    monkeypatch.setattr(firebase_service, "SPOOL_DIR", str(spool))
+    monkeypatch.setattr(firebase_service, "SPOOL_MOVED_DIR", str(spool / "moved"))
+    monkeypatch.setattr(firebase_service, "SPOOL_DEAD_DIR", str(spool / "dead"))
+    os.makedirs(spool / "moved")
+    os.makedirs(spool / "dead")
+
+    svc = FirebaseService.__new__(FirebaseService)
+    svc.media = MediaService(media_dir=str(tmp_path / "media"), base_url="http://backend")
+    svc.cache = MemoryCache()
+    svc.storage_breaker = CircuitBreaker("storage", probe=lambda: None)
+    svc.firestore_breaker = CircuitBreaker("firestore", probe=lambda: None)
+    svc.reconcile_lock = threading.Lock()
+    svc.reconcile_timer = None
+    svc.assets = {}
+    svc.db = FakeCollection(svc.assets)
+    svc.uploads = []
+    svc.upload_error = None
+    svc.scheduled = []
+    svc._schedule_reconcile = svc.scheduled.append
+
+    def upload(file_bytes, name, content_type):
+        if svc.upload_error:
+            raise svc.upload_error
+        svc.uploads.append(name)
+        return f"https://storage.googleapis.com/bucket/{name}"
+
+    svc._upload_blob = upload
+    return svc
+
+
+def spool_file(svc, data=b"video-bytes"):
+    name = svc.media.hashed_name(data, "u1/clip.mp4")
+    url = svc.save_local(data, name)
+    svc._spool("file", {"name": name, "contentType": "video/mp4", "url": url})
+    # Age it past SPOOL_MIN_AGE so replay picks it up
+    for entry_name in spool_entries():
+        path = os.path.join(firebase_service.SPOOL_DIR, entry_name)
+        with open(path) as f:
+            entry = json.load(f)
+        entry["spooledAt"] -= firebase_service.SPOOL_MIN_AGE + 1
+        with open(path, "w") as f:
+            json.dump(entry, f)
+    return name, url
+
+
+def spool_asset(svc, url, asset_id="a1"):
+    svc._spool("asset", {
+        "userId": "u1",
+        "assetId": asset_id,
+        "data": {"id": asset_id, "url": url, "type": "video", "createdAt": time.time() * 1000},
+    })
+
+
+def spool_entries(directory=None):
+    return sorted(f for f in os.listdir(directory or firebase_service.SPOOL_DIR) if f.endswith(".json"))
+
+
+def test_replays_file_then_asset_with_bucket_url(service):
+    name, url = spool_file(service)
+    spool_asset(service, url)
+
+    service.reconcile_spool()
+
+    assert service.uploads == [name]
+    assert service.assets["a1"]["url"] == f"https://storage.googleapis.com/bucket/{name}"
+    assert not os.path.exists(service.media.path_for(service.media.name_from_url(url)))
+    assert spool_entries() == []
+
+
+def test_asset_replayed_in_a_later_run_uses_bucket_url(service):
+    name, url = spool_file(service)
+    service.reconcile_spool()
+
+    spool_asset(service, url)
+    service.reconcile_spool()
+
+    assert service.assets["a1"]["url"] == f"https://storage.googleapis.com/bucket/{name}"
+
+
+def test_missing_local_file_is_dead_lettered_and_replay_continues(service):
+    _, url = spool_file(service)
+    spool_asset(service, url)
+    os.remove(service.media.path_for(service.media.name_from_url(url)))
+
+    service.reconcile_spool()
+
+    assert spool_entries() == []
+    assert len(spool_entries(firebase_service.SPOOL_DEAD_DIR)) == 1
+    assert "a1" in service.assets
+
+
+def test_rejected_upload_is_dead_lettered_and_keeps_local_copy(service):
+    _, url = spool_file(service)
+    spool_asset(service, url)
+    service.upload_error = Forbidden("bucket says no")
+
+    service.reconcile_spool()
+
+    assert len(spool_entries(firebase_service.SPOOL_DEAD_DIR)) == 1
+    assert service.assets["a1"]["url"] == url
+    assert os.path.exists(service.media.path_for(service.media.name_from_url(url)))
+
+
+@pytest.mark.parametrize("error", [RuntimeError("connection reset"), TooManyRequests("slow down")])
+def test_transient_error_stops_and_schedules_retry(service, error):
+    _, url = spool_file(service)
+    spool_asset(service, url)
+    service.upload_error = error
+    service.scheduled.clear()
+
+    service.reconcile_spool()
+
+    assert len(spool_entries()) == 2
+    assert spool_entries(firebase_service.SPOOL_DEAD_DIR) == []
+    assert service.assets == {}
+    assert service.scheduled == [firebase_service.SPOOL_RETRY_DELAY]
+
+    service.upload_error = None
+    service.reconcile_spool()
+    assert spool_entries() == []
+    assert "a1" in service.assets
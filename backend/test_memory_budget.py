@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, File, Request, UploadFile
+
+from backend.services.memory_budget_service import (
+    DEFAULT_REQUEST_ESTIMATE, MemoryBudget, MemoryBudgetMiddleware, track_bytes,
+)
+
+MB = 1024 * 1024
+
+
+def make_app(budget):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        content = await file.read()
+        track_bytes(len(content))
+        return {"size": len(content)}
+
+    @app.post("/raw")
+    async def raw(request: Request):
+        return {"size": len(await request.body())}
+
+    app.add_middleware(MemoryBudgetMiddleware, budget=budget, paths=["/upload", "/raw"])
+    return app
+
+
+def post(app, path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, **kwargs)
+
+    return asyncio.run(run())
+
+
+def chunked(total, chunk=MB):
+    async def body():
+        sent = 0
+        while sent < total:
+            size = min(chunk, total - sent)
+            sent += size
+            yield b"x" * size
+
+    return body()
+
+
+def test_request_with_content_length_is_admitted_and_released():
+    budget = MemoryBudget(limit_bytes=64 * MB)
+    response = post(make_app(budget), "/upload", files={"file": ("a.png", b"x" * MB, "image/png")})
+    assert response.status_code == 200
+    assert budget.stats()["usedBytes"] == 0
+    assert budget.stats()["peakBytes"] >= 2 * MB  # Body plus the tracked result
+
+
+def test_chunked_body_within_budget_is_topped_up():
+    budget = MemoryBudget(limit_bytes=64 * MB)
+    response = post(make_app(budget), "/raw", content=chunked(DEFAULT_REQUEST_ESTIMATE + 4 * MB))
+    assert response.status_code == 200
+    assert response.json()["size"] == DEFAULT_REQUEST_ESTIMATE + 4 * MB
+    assert budget.stats()["peakBytes"] > DEFAULT_REQUEST_ESTIMATE
+    assert budget.stats()["usedBytes"] == 0
+
+
+def test_chunked_body_beyond_budget_is_rejected():
+    budget = MemoryBudget(limit_bytes=16 * MB)
+    response = post(make_app(budget), "/raw", content=chunked(40 * MB))
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert budget.stats()["usedBytes"] == 0
+
+
+def test_chunked_multipart_beyond_budget_is_rejected_not_400():
+    budget = MemoryBudget(limit_bytes=16 * MB)
+    boundary = "b0undary"
+    total = 40 * MB
+
+    async def body():
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n"
+               "Content-Type: image/png\r\n\r\n").encode()
+        async for chunk in chunked(total):
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = post(make_app(budget), "/upload", content=body(),
+                    headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 503
+    assert budget.stats()["usedBytes"] == 0
+
+
+def test_queue_timeout_returns_503():
+    budget = MemoryBudget(limit_bytes=4 * MB, queue_timeout=0.05)
+    app = make_app(budget)
+
+    async def run():
+        held = await budget.acquire(4 * MB)
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/raw", content=b"x" * MB)
+        finally:
+            held.release()
+
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert budget.stats()["rejected"] == 1
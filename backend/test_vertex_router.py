@@ -0,0 +1,183 @@
+import asyncio
+
+import httpx
+import pytest
+from google.genai import errors
+
+from backend.services.vertex_router_service import VertexRouter
+
+ENDPOINTS = {"*": [{"project": "p", "location": "slow"}, {"project": "p", "location": "fast"}]}
+
+
+class FakeClient:
+    """Stand-in for a genai client in one region: answers after `latency` seconds, or raises."""
+
+    def __init__(self, location, latency, error=None):
+        self.location = location
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return self.location
+
+    def generate_sync(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.location
+
+
+def client_error(code):
+    return errors.ClientError(code, {"error": {"code": code, "message": "rejected", "status": "INVALID_ARGUMENT"}})
+
+
+def make_router(clients, hedge_delay=None):
+    router = VertexRouter(endpoints=ENDPOINTS, client_factory=lambda project, location: clients[location])
+    if hedge_delay is not None:
+        router.hedge_delay = lambda model: hedge_delay
+    return router
+
+
+def stats(router, location):
+    return router._stats("m", ("p", location))
+
+
+def test_ranking_prefers_lower_latency():
+    router = make_router({"slow": FakeClient("slow", 0), "fast": FakeClient("fast", 0)})
+    stats(router, "slow").record(1.0)
+    stats(router, "fast").record(0.1)
+    assert router.ranked("m")[0] == ("p", "fast")
+
+
+def test_ranking_demotes_failing_endpoint():
+    router = make_router({"slow": FakeClient("slow", 0), "fast": FakeClient("fast", 0)})
+    stats(router, "fast").record(0.1)
+    stats(router, "slow").record(None, error=True)
+    assert router.ranked("m") == [("p", "fast"), ("p", "slow")]
+
+
+def test_sync_call_fails_over_to_next_endpoint():
+    clients = {"slow": FakeClient("slow", 0, error=RuntimeError("down")), "fast": FakeClient("fast", 0)}
+    router = make_router(clients)
+    assert router.call("m", lambda client: client.generate_sync()) == "fast"
+    assert stats(router, "slow").error_rate > 0
+    assert router.ranked("m")[0] == ("p", "fast")
+
+
+def test_sync_call_raises_when_all_endpoints_fail():
+    error = RuntimeError("down")
+    clients = {"slow": FakeClient("slow", 0, error=error), "fast": FakeClient("fast", 0, error=error)}
+    with pytest.raises(RuntimeError):
+        make_router(clients).call("m", lambda client: client.generate_sync())
+
+
+def test_async_call_fails_over_without_hedging():
+    clients = {"slow": FakeClient("slow", 0.01, error=RuntimeError("down")), "fast": FakeClient("fast", 0.01)}
+    router = make_router(clients)
+    assert asyncio.run(router.call_async("m", lambda client: client.generate())) == "fast"
+
+
+def test_unhedged_call_waits_for_primary():
+    clients = {"slow": FakeClient("slow", 0.1), "fast": FakeClient("fast", 0.01)}
+    router = make_router(clients, hedge_delay=0.02)
+    assert asyncio.run(router.call_async("m", lambda client: client.generate(), hedge=False)) == "slow"
+    assert clients["fast"].calls == 0
+
+
+def test_hedge_cancels_slow_primary():
+    clients = {"slow": FakeClient("slow", 1.0), "fast": FakeClient("fast", 0.02)}
+    router = make_router(clients, hedge_delay=0.05)
+    assert asyncio.run(router.call_async("m", lambda client: client.generate(), hedge=True)) == "fast"
+    assert clients["slow"].cancelled == 1
+
+
+def test_hedge_losers_do_not_pull_latency_down():
+    clients = {"slow": FakeClient("slow", 1.0), "fast": FakeClient("fast", 0.02)}
+    router = make_router(clients, hedge_delay=0.05)
+
+    async def run():
+        for _ in range(6):
+            await router.call_async("m", lambda client: client.generate(), hedge=True)
+
+    asyncio.run(run())
+    slow, fast = stats(router, "slow"), stats(router, "fast")
+    # The cancelled attempt ran for at least the hedge delay, and is never a latency sample
+    assert slow.ewma_latency >= 0.05
+    assert len(slow.latencies) == 0
+    assert slow.ewma_latency > fast.ewma_latency
+    assert router.ranked("m")[0] == ("p", "fast")
+    # Once ranked first, the fast region answers before any hedge is needed
+    assert clients["slow"].calls == 1
+
+
+def test_caller_cancellation_records_nothing():
+    clients = {"slow": FakeClient("slow", 1.0), "fast": FakeClient("fast", 1.0)}
+    router = make_router(clients, hedge_delay=0.01)
+
+    async def run():
+        task = asyncio.ensure_future(router.call_async("m", lambda client: client.generate(), hedge=True))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert clients["slow"].cancelled == 1
+    assert clients["fast"].cancelled == 1
+    for location in ("slow", "fast"):
+        assert stats(router, location).ewma_latency is None
+        assert stats(router, location).error_rate == 0
+
+
+def test_sync_request_error_is_not_failed_over_or_counted():
+    clients = {"slow": FakeClient("slow", 0, error=client_error(400)), "fast": FakeClient("fast", 0)}
+    router = make_router(clients)
+    with pytest.raises(errors.ClientError):
+        router.call("m", lambda client: client.generate_sync())
+    assert clients["fast"].calls == 0
+    assert stats(router, "slow").error_rate == 0
+
+
+def test_sync_rate_limit_is_failed_over():
+    clients = {"slow": FakeClient("slow", 0, error=client_error(429)), "fast": FakeClient("fast", 0)}
+    router = make_router(clients)
+    assert router.call("m", lambda client: client.generate_sync()) == "fast"
+    assert stats(router, "slow").error_rate > 0
+
+
+def test_sync_without_failover_only_retries_connection_errors():
+    clients = {"slow": FakeClient("slow", 0, error=TimeoutError("read timeout")), "fast": FakeClient("fast", 0)}
+    with pytest.raises(TimeoutError):
+        make_router(clients).call("m", lambda client: client.generate_sync(), failover=False)
+    assert clients["fast"].calls == 0
+
+    clients["slow"].error = httpx.ConnectError("refused")
+    assert make_router(clients).call("m", lambda client: client.generate_sync(), failover=False) == "fast"
+
+
+def test_async_request_error_is_not_failed_over_or_counted():
+    clients = {"slow": FakeClient("slow", 0.01, error=client_error(400)), "fast": FakeClient("fast", 0.01)}
+    router = make_router(clients)
+    with pytest.raises(errors.ClientError):
+        asyncio.run(router.call_async("m", lambda client: client.generate(), hedge=True))
+    assert clients["fast"].calls == 0
+    assert stats(router, "slow").error_rate == 0
+
+
+def test_hedged_request_error_ends_the_race():
+    clients = {"slow": FakeClient("slow", 1.0), "fast": FakeClient("fast", 0.02, error=client_error(400))}
+    router = make_router(clients, hedge_delay=0.05)
+    with pytest.raises(errors.ClientError):
+        asyncio.run(router.call_async("m", lambda client: client.generate(), hedge=True))
+    assert clients["slow"].cancelled == 1
+    assert stats(router, "fast").error_rate == 0
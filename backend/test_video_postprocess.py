@@ -0,0 +1,117 @@
+import struct
+
+import pytest
+
+from backend.services.video_postprocess_service import VideoPostProcessService, _find_box
+
+SAMPLES = [b"frame-one", b"frame-two!", b"frame-three"]
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mvhd(version, timescale, duration):
+    if version == 1:
+        payload = struct.pack(">B3xQQIQ", 1, 0, 0, timescale, duration)
+        return box(b"mvhd", payload.ljust(112, b"\0"))
+    payload = struct.pack(">B3xIIII", 0, 0, 0, timescale, duration)
+    return box(b"mvhd", payload.ljust(100, b"\0"))
+
+
+def tkhd(version, width, height):
+    dims = struct.pack(">II", width << 16, height << 16)
+    if version == 1:
+        return box(b"tkhd", struct.pack(">B3x", 1).ljust(88, b"\0") + dims)
+    return box(b"tkhd", struct.pack(">B3x", 0).ljust(76, b"\0") + dims)
+
+
+def chunk_offsets(box_type, offsets):
+    fmt = ">I" if box_type == b"stco" else ">Q"
+    payload = struct.pack(">4xI", len(offsets)) + b"".join(struct.pack(fmt, o) for o in offsets)
+    return box(box_type, payload)
+
+
+def moov(offsets, version=0, offset_box=b"stco"):
+    stbl = box(b"stbl", chunk_offsets(offset_box, offsets))
+    trak = box(b"trak", tkhd(version, 1280, 720) + box(b"mdia", box(b"minf", stbl)))
+    return box(b"moov", mvhd(version, 1000, 6000) + trak)
+
+
+def make_mp4(faststart=False, version=0, offset_box=b"stco"):
+    """ftyp + mdat + moov (or ftyp + moov + mdat) with one chunk offset per sample."""
+    ftyp = box(b"ftyp", b"isom\0\0\0\0isom")
+    mdat_payload = b"".join(SAMPLES)
+
+    def layout(offsets):
+        movie = moov(offsets, version, offset_box)
+        if faststart:
+            return ftyp + movie + box(b"mdat", mdat_payload)
+        return ftyp + box(b"mdat", mdat_payload) + movie
+
+    # Offsets depend on where mdat ends up, which depends on moov's (fixed) size
+    placeholder = layout([0] * len(SAMPLES))
+    mdat_start = placeholder.index(b"mdat") + 4
+    offsets, pos = [], mdat_start
+    for sample in SAMPLES:
+        offsets.append(pos)
+        pos += len(sample)
+    return layout(offsets)
+
+
+def read_offsets(data):
+    for box_type in (b"stco", b"co64"):
+        found = _find_box(data, [b"moov", b"trak", b"mdia", b"minf", b"stbl", box_type])
+        if found:
+            fmt = ">I" if box_type == b"stco" else ">Q"
+            payload = found[0]
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            width = struct.calcsize(fmt)
+            return [struct.unpack_from(fmt, data, payload + 8 + i * width)[0] for i in range(count)]
+    return []
+
+
+def samples_at(data):
+    return [data[offset:offset + len(sample)] for offset, sample in zip(read_offsets(data), SAMPLES)]
+
+
+@pytest.mark.parametrize("offset_box", [b"stco", b"co64"])
+def test_faststart_moves_moov_and_keeps_offsets_pointing_at_samples(offset_box):
+    original = make_mp4(offset_box=offset_box)
+    assert samples_at(original) == SAMPLES
+
+    rewritten = VideoPostProcessService().faststart(original)
+
+    assert len(rewritten) == len(original)
+    assert rewritten.index(b"moov") < rewritten.index(b"mdat")
+    assert samples_at(rewritten) == SAMPLES
+
+
+def test_faststart_leaves_faststart_input_unchanged():
+    original = make_mp4(faststart=True)
+    assert VideoPostProcessService().faststart(original) is original
+
+
+def test_faststart_rejects_non_mp4():
+    with pytest.raises(ValueError):
+        VideoPostProcessService().faststart(box(b"ftyp", b"isom") + box(b"free", b""))
+
+
+@pytest.mark.parametrize("data", [b"not a video at all", b"\x00\x00\x00\x20ftyp", box(b"ftyp", b"isom")])
+def test_process_passes_non_mp4_through(data):
+    processed, info = VideoPostProcessService().process(data)
+    assert processed == data
+    assert info == {"duration": None, "width": None, "height": None}
+
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_probe_reads_duration_and_dimensions(version):
+    info = VideoPostProcessService().probe(make_mp4(version=version))
+    assert info == {"duration": 6.0, "width": 1280, "height": 720}
+
+
+def test_process_returns_faststart_bytes_and_metadata():
+    processed, info = VideoPostProcessService().process(make_mp4())
+    assert processed.index(b"moov") < processed.index(b"mdat")
+    assert samples_at(processed) == SAMPLES
+    assert info["duration"] == 6.0